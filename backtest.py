@@ -12,12 +12,42 @@ def help():
 
 banner = """Back Testing Trading Strategy Console
 type help() for assistance."""
+
+
+class Demo(object):
+    """ The demo back test of bollinger over goog, run when first used
+
+    A global of the console, so functions defined at the prompt see it too.
+    """
+
+    def __init__(self):
+        self.__dict__['_backtest'] = None
+
+    def _get(self):
+        if self._backtest is None:
+            backtest = BackTest()
+            backtest(goog, bollinger)
+            backtest.cost = lambda trade: 0.5 * trade / 100
+            self.__dict__['_backtest'] = backtest
+        return self._backtest
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+    def __call__(self, *args):
+        return self._get()(*args)
+
+    def __repr__(self):
+        return repr(self._get())
+
+
 bollinger = Bollinger(30, 1)
 monkey = Monkey(30)
-goog = Stock('GOOG')
-backtest = BackTest()
-backtest(goog, bollinger)
-backtest.cost = lambda trade: 0.5 * trade / 100
+goog = Stock('GOOG')  # loaded when first used
+backtest = Demo()
 
 
 code.interact(banner=banner, local=locals())
@@ -0,0 +1,330 @@
+""" Benchmarks of the import, load, indicator, back test and plotting hot paths
+
+Run from the repository root:
+
+    python -m bench.suite                         # compare with the baseline
+    python -m bench.suite --sizes 10000,10000000  # synthetic series sizes
+    python -m bench.suite --save                  # record a new baseline
+
+Each benchmark runs in its own process, repeated for at least half a second,
+and reports its throughput (items per second) and peak memory (MB above the
+memory in use before the timed part). The stream benchmark feeds bars one at
+a time, its seconds per item is the per bar latency. Throughput lower or peak
+memory higher than the baseline by more than the tolerance is reported as a
+regression and the exit status is 1. Baselines are machine specific, record
+one before comparing on a new machine. A benchmark raising an exception or
+killing its process is reported as an error, with its traceback, and the exit
+status is 1.
+"""
+
+import argparse
+import functools
+import cPickle as pickle
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing import Process, Queue
+from Queue import Empty
+
+import numpy
+
+from lib import montecarlo, plot, store
+from lib.sweep import sweep
+from lib.backtest import BackTest
+from lib.cost import Cost
+from lib.stock import Stock
+from strategy import Bollinger, Monkey
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, 'tests', 'fixtures', 'GOOG_2012-05-25')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+# per tick benchmarks run over at most TICKS ticks of the synthetic series
+TICKS = 100000
+PLOT_TICKS = 1000000
+# fast benchmarks are repeated for at least MINIMUM seconds
+MINIMUM = 0.5
+
+
+def fixture(*args):
+    with open(FIXTURE) as f:
+        return pickle.load(f)
+
+
+def synthetic(size, seed=0):
+    """ Stock following a random walk over size days """
+    random_state = numpy.random.RandomState(seed)
+    close = 100 * numpy.exp(numpy.cumsum(random_state.normal(0, 0.01, size)))
+    spread = close * random_state.uniform(0, 0.01, size)
+    stock = Stock()
+    stock.symbol = 'SYNTHETIC'
+    stock.set_columns([numpy.arange(size).astype('M8[D]'), close,
+                       close + spread, close - spread, close,
+                       random_state.randint(1000, 100000, size), close])
+    return stock
+
+
+def bench_import(size):
+    command = [sys.executable, '-c', 'from lib import Stock, BackTest']
+    return 1, lambda: subprocess.check_call(command, cwd=ROOT)
+
+
+def bench_parse(size):
+    raw = fixture()
+    return len(raw) - 1, lambda: Stock.parse(raw)
+
+
+def bench_cast(size):
+    raw = fixture()
+    return len(raw) - 1, lambda: [Stock.cast(tick) for tick in raw[1:]]
+
+
+def bench_load(size):
+    Stock.save_to_cache('BENCH', Stock.parse(fixture()))
+    return len(fixture()) - 1, lambda: len(Stock('BENCH', fixture))
+
+
+def bench_tick_indicators(size):
+    stock = synthetic(min(size, TICKS))
+
+    def run():
+        for tick in stock:
+            tick.ma(30)
+            tick.std(30)
+            tick.upper_bb(30, 1)
+    return len(stock), run
+
+
+def bench_stock_indicators(size):
+    stock = synthetic(size)
+
+    def run():
+        stock.set_columns([getattr(stock, field) for field in Stock.fields])
+        stock.upper_bb(30, 1)
+        stock.lower_bb(30, 1)
+    return size, run
+
+
+def bench_backtest_bollinger(size):
+    stock = synthetic(size)
+    return size, lambda: BackTest()(stock, Bollinger(30, 1))
+
+
+def bench_backtest_bollinger_per_tick(size):
+    stock = synthetic(min(size, TICKS))
+    bollinger = Bollinger(30, 1)
+    return len(stock), lambda: BackTest()(stock, lambda tick: bollinger(tick))
+
+
+def bench_backtest_monkey(size):
+    stock = synthetic(min(size, TICKS))
+    random.seed(0)
+    return len(stock), lambda: BackTest()(stock, Monkey(30))
+
+
+def bench_stream(size):
+    stock = synthetic(min(size, TICKS))
+
+    def run():
+        for backtest in BackTest().stream(Stock(), Bollinger(30, 1),
+                                          stock.bars()):
+            backtest.net
+    return len(stock), run
+
+
+def bench_monte_carlo(size):
+    stock = synthetic(min(size, TICKS))
+    runs = 1000
+    return runs * len(stock), lambda: montecarlo.seeded(
+        functools.partial(Monkey, 30), stock, runs, processes=1)
+
+
+def bench_sweep_grid(size):
+    stock = synthetic(min(size, TICKS))
+    grid = {'n': range(5, 205), 'k': numpy.linspace(0.5, 3, 20).tolist()}
+    return 4000 * len(stock), lambda: sweep(Bollinger, grid, [stock],
+                                            processes=1)
+
+
+def bench_pnl(size):
+    backtest = BackTest()(synthetic(size), Bollinger(30, 1))
+    backtest.cost = lambda trade: 0.5 * trade / 100
+    queries = 1000
+
+    def run():
+        for index in xrange(queries):
+            backtest.gross, backtest.net, backtest.position
+    return 3 * queries, run
+
+
+def bench_cost_sensitivity(size):
+    backtest = BackTest()(synthetic(size), Bollinger(30, 1))
+    costs = [Cost(fixed, bps, slippage, 1) for fixed in (0, 1, 5)
+             for bps in (0, 5, 10, 50) for slippage in (0, 0.1)]
+    return len(costs) * len(backtest.trades), \
+        lambda: backtest.sensitivity(costs)
+
+
+def bench_plot(size):
+    backtest = BackTest()(synthetic(min(size, PLOT_TICKS)), Bollinger(30, 1))
+    backtest.plot()  # matplotlib is imported by the first rendering
+    return len(backtest.stock), backtest.plot
+
+
+def bench_render_many(size):
+    stock = synthetic(min(size, PLOT_TICKS))
+    charts = [BackTest()(stock, Bollinger(n, 1)).chart()
+              for n in (10, 20, 30, 40)]
+    plot.render_many(charts[:1])
+    return len(charts) * len(stock), lambda: plot.render_many(charts)
+
+
+BENCHMARKS = [
+    ('import', bench_import, False),
+    ('parse', bench_parse, False),
+    ('cast', bench_cast, False),
+    ('load', bench_load, False),
+    ('tick_indicators', bench_tick_indicators, True),
+    ('stock_indicators', bench_stock_indicators, True),
+    ('backtest_bollinger', bench_backtest_bollinger, True),
+    ('backtest_bollinger_per_tick', bench_backtest_bollinger_per_tick, True),
+    ('backtest_monkey', bench_backtest_monkey, True),
+    ('stream', bench_stream, True),
+    ('monte_carlo', bench_monte_carlo, True),
+    ('sweep_grid', bench_sweep_grid, True),
+    ('pnl', bench_pnl, True),
+    ('cost_sensitivity', bench_cost_sensitivity, True),
+    ('plot', bench_plot, True),
+    ('render_many', bench_render_many, True),
+]
+
+
+def measure(benchmark, size, queue):
+    """ time benchmark in a scratch directory, put the result in queue
+
+    The result of a benchmark raising an exception is its traceback under
+    'error'.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        os.chdir(directory)
+        os.mkdir('png')
+        store.CACHE = os.path.join(directory, 'cache')
+        items, run = benchmark(size)
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        repeat = 0
+        start = time.time()
+        while not repeat or time.time() - start < MINIMUM:
+            run()
+            repeat += 1
+        seconds = (time.time() - start) / repeat
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory
+        queue.put({'items': items, 'seconds': seconds,
+                   'throughput': items / max(seconds, 1e-9),
+                   'memory': memory / 1024.0})
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+    finally:
+        shutil.rmtree(directory)
+
+
+def receive(process, queue, timeout=1):
+    """ result put in queue by process, an error if it exits without one """
+    while True:
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            if process.exitcode is None:
+                continue
+        try:
+            # the process may have put its result just before exiting
+            return queue.get(timeout=timeout)
+        except Empty:
+            return {'error': 'benchmark process exited with code {0}'
+                             .format(process.exitcode)}
+
+
+def run(names=None, sizes=(10000, 100000)):
+    """ Results of the benchmarks by name then size """
+    results = {}
+    for name, benchmark, synthetic_ in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for size in sizes if synthetic_ else ['fixture']:
+            queue = Queue()
+            process = Process(target=measure, args=(benchmark, size, queue))
+            process.start()
+            result = receive(process, queue)
+            process.join()
+            results.setdefault(name, {})[str(size)] = result
+    return results
+
+
+def compare(results, baseline, tolerance=0.3):
+    """ List of (name, size, message) regressions against baseline """
+    regressions = []
+    for name, sizes in sorted(results.items()):
+        for size, result in sorted(sizes.items()):
+            reference = baseline.get(name, {}).get(size)
+            if reference is None or 'error' in result:
+                continue
+            if result['throughput'] < reference['throughput'] * (1 - tolerance):
+                regressions.append((name, size, 'throughput {0:.0f} < {1:.0f}'
+                                    .format(result['throughput'],
+                                            reference['throughput'])))
+            if result['memory'] > max(reference['memory'], 1) * (1 + tolerance):
+                regressions.append((name, size, 'memory {0:.1f}MB > {1:.1f}MB'
+                                    .format(result['memory'],
+                                            reference['memory'])))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Back test benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run')
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='comma separated synthetic series sizes')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.3)
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run(args.names, sizes)
+    errors = []
+    for name, by_size in sorted(results.items()):
+        for size, result in sorted(by_size.items()):
+            if 'error' in result:
+                errors.append((name, size, result['error']))
+                continue
+            print '{0:30} {1:>9} {2:9.4f}s {3:12.0f}/s {4:8.1f}MB'.format(
+                name, size, result['seconds'], result['throughput'],
+                result['memory'])
+    for error in errors:
+        print 'ERROR {0} {1}:\n{2}'.format(*error)
+    if errors:
+        return 1
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print 'REGRESSION {0} {1}: {2}'.format(*regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -12,6 +12,8 @@
 
 import urllib
 
+import numpy
+
 
 """
 This is the "ystockquote" module.
@@ -141,6 +143,18 @@ def get_short_ratio(symbol):
     return __request(symbol, 's7')
 
 
+def __historical_url(symbol, start_date, end_date):
+    return 'http://ichart.yahoo.com/table.csv?s=%s&' % symbol + \
+           'd=%s&' % str(int(end_date[4:6]) - 1) + \
+           'e=%s&' % str(int(end_date[6:8])) + \
+           'f=%s&' % str(int(end_date[0:4])) + \
+           'g=d&' + \
+           'a=%s&' % str(int(start_date[4:6]) - 1) + \
+           'b=%s&' % str(int(start_date[6:8])) + \
+           'c=%s&' % str(int(start_date[0:4])) + \
+           'ignore=.csv'
+
+
 def get_historical_prices(symbol, start_date, end_date):
     """
     Get historical prices for the given ticker symbol.
@@ -148,15 +162,98 @@ def get_historical_prices(symbol, start_date, end_date):
 
     Returns a nested list.
     """
-    url = 'http://ichart.yahoo.com/table.csv?s=%s&' % symbol + \
-          'd=%s&' % str(int(end_date[4:6]) - 1) + \
-          'e=%s&' % str(int(end_date[6:8])) + \
-          'f=%s&' % str(int(end_date[0:4])) + \
-          'g=d&' + \
-          'a=%s&' % str(int(start_date[4:6]) - 1) + \
-          'b=%s&' % str(int(start_date[6:8])) + \
-          'c=%s&' % str(int(start_date[0:4])) + \
-          'ignore=.csv'
+    url = __historical_url(symbol, start_date, end_date)
     days = urllib.urlopen(url).readlines()
     data = [day[:-2].split(',') for day in days]
     return data
+
+
+def iter_historical_prices(symbol, start_date, end_date, chunk_size=65536):
+    """
+    Stream historical prices for the given ticker symbol.
+    Date format is 'YYYYMMDD'
+
+    Returns an iterator of typed chunks, cf. parse_historical_prices.
+    """
+    url = __historical_url(symbol, start_date, end_date)
+    return parse_historical_prices(urllib.urlopen(url), chunk_size)
+
+
+def parse_historical_prices(f, chunk_size=65536):
+    """
+    Parse historical prices CSV from the file like object f, reading
+    chunk_size bytes at a time and skipping the header line.
+
+    Yields (dates, values) for the lines of each chunk, in file order: dates
+    a datetime64 array and values a 2D float array whose columns are open,
+    high, low, close, volume and adjusted close.
+
+    >>> import StringIO
+    >>> csv = StringIO.StringIO('Date,Open,High,Low,Close,Volume,Adj Close\\n'
+    ...                         '2012-05-25,601.00,601.73,588.28,591.53,3581900,591.53\\n')
+    >>> [(list(dates), values.tolist()) for dates, values
+    ...  in parse_historical_prices(csv)]
+    [([numpy.datetime64('2012-05-25')], [[601.0, 601.73, 588.28, 591.53, 3581900.0, 591.53]])]
+    """
+    header = True
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop() if chunk else ''
+        if header and lines:
+            lines.pop(0)
+            header = False
+        lines = [line.rstrip('\r') for line in lines if line.strip()]
+        if lines:
+            yield parse_rows([line.split(',', 1) for line in lines])
+        if not chunk:
+            return
+
+
+def parse_rows(rows):
+    """
+    Typed (dates, values) of rows each holding a date and the comma separated
+    values, or all the fields as strings.
+
+    Each row holds open, high, low, close and volume, then the adjusted close
+    unless none of the rows does. Rows holding another number of values, or a
+    date or value which can't be parsed, like Yahoo's null, are dropped.
+
+    >>> dates, values = parse_rows([['2012-05-24', '1,2,3,4,5,6'],
+    ...                             ['2012-05-25', 'null,2,3,4,5,6'],
+    ...                             ['2012-05-26', '1,2,3,4,5']])
+    >>> list(dates), values.tolist()
+    ([numpy.datetime64('2012-05-24')], [[1.0, 2.0, 3.0, 4.0, 5.0, 6.0]])
+    """
+    fields = [','.join(row[1:]) for row in rows]
+    counts = [field.count(',') + 1 for field in fields]
+    width = 6 if 6 in counts else 5
+    kept = [index for index, count in enumerate(counts) if count == width]
+    try:
+        dates = numpy.array([rows[index][0] for index in kept], dtype='M8')
+    except ValueError:
+        kept = [index for index in kept if _parses(numpy.datetime64,
+                                                   rows[index][0])]
+        dates = numpy.array([rows[index][0] for index in kept], dtype='M8')
+    values = numpy.fromstring(','.join(fields[index] for index in kept),
+                              sep=',')
+    if len(values) != len(kept) * width:
+        # fromstring stopped at a value it couldn't parse
+        valid = [_parses(float, value) for index in kept
+                 for value in fields[index].split(',')]
+        valid = numpy.array(valid, dtype=bool).reshape(len(kept), width)
+        valid = valid.all(axis=1)
+        kept = [index for index, ok in zip(kept, valid) if ok]
+        dates = dates[valid]
+        values = numpy.array([fields[index].split(',') for index in kept],
+                             dtype='f8')
+    return dates, values.reshape(len(kept), width)
+
+
+def _parses(cast, value):
+    try:
+        cast(value)
+    except ValueError:
+        return False
+    return True
@@ -1,11 +1,292 @@
-from collections import namedtuple, Counter
+from collections import namedtuple
 
-from matplotlib.pyplot import plot, subplot2grid, ylim, yticks, savefig, clf, \
-    fill_between
+import numpy
+
+import plot
+from cost import Cost, trade_costs
+from indicator import append_to, reserve
 
 
 Trade = namedtuple('Trade', ['order', 'tick'])
 
+# record of a trade in a Ledger
+TRADE = numpy.dtype([('tick', 'i8'), ('side', 'i1'), ('price', 'f8'),
+                     ('volume', 'f8'), ('cost', 'f8')])
+
+
+def execute(signals, position=0):
+    """ Tick indices and orders of the trades triggered by a signal array
+
+    signals holds 1 (buy), -1 (sell) or 0 (None) for each tick. Orders follow
+    the BackTest rules, a buy is executed unless long and a sell unless short,
+    and are returned as 1 for buy and -1 for sell.
+
+    >>> execute(numpy.array([1, 1, 0, -1, 1, -1, -1]))
+    (array([0, 3, 4, 5, 6]), array([ 1, -1,  1, -1, -1], dtype=int8))
+
+    position is the numeric position before the first tick, e.g. at the end
+    of the previous chunk of a long signal array.
+
+    >>> execute(numpy.array([1, 1, 0, -1]), position=1)
+    (array([3]), array([-1], dtype=int8))
+    """
+    signals = numpy.asarray(signals)
+    if position:
+        # two signals of the position side lead to it whatever came before
+        signals = numpy.concatenate(([position] * 2, signals))
+    ticks, columns, sides = execute_columns(signals[:, None])
+    if position:
+        executed = ticks >= 2
+        ticks, sides = ticks[executed] - 2, sides[executed]
+    return ticks, sides
+
+
+def execute_columns(signals):
+    """ Tick indices, column indices and orders of the trades for a 2D array
+
+    Each column of signals is a signal array executed independently, cf.
+    execute. Trades are ordered by column then tick.
+
+    Non zero signals are grouped in runs of identical signals. A run starting
+    flat or lasting at least 2 signals ends at its own side. A single signal
+    run following a run that ended at its side flattens the position, so
+    after such an anchor the runs alternate between flat and their side.
+    """
+    signals = numpy.asarray(signals)
+    flat = signals.ravel(order='F')
+    nonzero = numpy.flatnonzero(flat)
+    columns, ticks = numpy.divmod(nonzero, len(signals))
+    sides = numpy.sign(flat[nonzero]).astype('i1')
+    if not len(nonzero):
+        return ticks, columns, sides
+    new_column = numpy.concatenate(([True], columns[1:] != columns[:-1]))
+    new_run = new_column.copy()
+    new_run[1:] |= sides[1:] != sides[:-1]
+    starts = numpy.flatnonzero(new_run)
+    first = new_column[starts]
+    lengths = numpy.diff(numpy.concatenate((starts, [len(nonzero)])))
+    runs = numpy.arange(len(starts))
+    anchors = numpy.where((lengths >= 2) | first, runs, 0)
+    anchors = numpy.maximum.accumulate(anchors)
+    position = sides[starts] * ((runs - anchors) % 2 == 0)
+    previous = numpy.concatenate(([0], position[:-1]))
+    previous[first] = 0
+    moves = numpy.abs(position - previous)
+    executed = numpy.sort(numpy.concatenate((starts, starts[moves == 2] + 1)))
+    return ticks[executed], columns[executed], sides[executed]
+
+
+def pnl_columns(close, signals, cost, volume=None):
+    """ Trades, position, gross and net pnl of each column of signals
+
+    Each column of the 2D signals array is executed (cf. execute_columns) and
+    traded at close, as a BackTest with the cost function would. close is the
+    price array shared by the columns or a matrix holding the prices of each
+    column, volume likewise or None. Returns four arrays with a value per
+    column.
+    """
+    ticks, columns, sides = execute_columns(signals)
+    count = signals.shape[1]
+    if close.ndim == 1:
+        prices, last = close[ticks], close[-1]
+        volumes = volume[ticks] if volume is not None else None
+    else:
+        prices, last = close[ticks, columns], close[-1]
+        volumes = volume[ticks, columns] if volume is not None else None
+    trades = numpy.bincount(columns, minlength=count)
+    position = numpy.bincount(columns, sides, count).astype(int)
+    gross = numpy.bincount(columns, -sides * prices, count)
+    costs = numpy.bincount(columns, trade_costs(cost, numpy.abs(prices),
+                                                volumes), count)
+    return trades, position, gross, position * last + gross - costs
+
+
+class Ledger(object):
+    """ List like running ledger of the trades of a back test
+
+    The trades are stored column wise in a numpy structured array of TRADE
+    records, the tick index, side (1 buy, -1 sell), price and volume of each
+    trade and its cost for the last cost function used, exported without
+    copy by the array attribute or numpy.asarray. The position, gross pnl
+    and trading cost accumulated after each trade are kept too, so that
+    their value at any tick is found by bisecting the tick indices of the
+    trades, which are appended in tick order.
+
+    >>> from lib.tick import Tick
+    >>> ledger = Ledger()
+    >>> ledger.append(Trade('buy', Tick([], 3, None, 1.0, 1.0, 1.0, 2.0, 1, 2.0)))
+    >>> ledger.position(2), ledger.position(3), ledger.gross(3)
+    (0, 1, -2.0)
+    >>> ledger.array['tick'], ledger.array['side']
+    (array([3]), array([1], dtype=int8))
+
+    Trade tuples are only created, from the stock, when indexing or
+    iterating.
+    """
+
+    sign = {'buy': 1, 'sell': -1}
+    orders = {1: 'buy', -1: 'sell'}
+
+    def __init__(self, trades=(), stock=None):
+        self.stock = stock
+        self._size = 0
+        # tick index of the last trade
+        self._last = None
+        self._records = numpy.empty(0, dtype=TRADE)
+        self._positions = numpy.zeros(1, dtype='i8')
+        self._gross = numpy.zeros(1)
+        self._costs = numpy.zeros(1)
+        self._cost_key = None
+        # number of trades whose cost is accumulated in _costs
+        self._cost_count = 0
+        self.extend(trades)
+
+    def __repr__(self):
+        return 'Ledger(trades=[{0}])'.format(len(self))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        """ Trade(order, tick) of the trade at index """
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        tick, side = self.array[index].tolist()[:2]
+        return Trade(Ledger.orders[side], self.stock[tick])
+
+    @property
+    def array(self):
+        """ TRADE records of the trades, a view of the ledger """
+        return self._records[:self._size]
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    def append(self, trade):
+        if self.stock is None:
+            self.stock = trade.tick.series
+        sign = Ledger.sign[trade.order]
+        size = self._size
+        tick = trade.tick
+        self._records = append_to(self._records, size,
+                                  (tick.index, sign, tick.close, tick.volume,
+                                   0.0))
+        self._positions = append_to(self._positions, size + 1,
+                                    self._positions[size] + sign)
+        self._gross = append_to(self._gross, size + 1,
+                                self._gross[size] - sign * tick.close)
+        self._size += 1
+        self._last = tick.index
+
+    def extend(self, trades):
+        for trade in trades:
+            self.append(trade)
+
+    def record(self, stock, ticks, sides):
+        """ Append the trades at the tick indices ticks of stock
+
+        sides holds 1 for buy and -1 for sell. The trades are recorded all at
+        once, without creating Trade or Tick objects.
+        """
+        ticks = numpy.asarray(ticks, dtype=int)
+        self.stock = stock
+        self._record(ticks, sides, stock.close[ticks], stock.volume[ticks])
+
+    def _record(self, ticks, sides, prices, volumes):
+        size, count = self._size, len(ticks)
+        self._records = reserve(self._records, size + count)
+        records = self._records[size:size + count]
+        records['tick'] = ticks
+        records['side'] = sides
+        records['price'] = prices
+        records['volume'] = volumes
+        records['cost'] = 0.0
+        sides = records['side']
+        for name, values in (('_positions', sides),
+                             ('_gross', -sides * records['price'])):
+            buffer = reserve(getattr(self, name), size + count + 1)
+            buffer[size + 1:size + count + 1] = numpy.cumsum(
+                numpy.concatenate((buffer[size:size + 1], values)))[1:]
+            setattr(self, name, buffer)
+        self._size += count
+        if count:
+            self._last = int(ticks[-1])
+
+    def dump(self, f):
+        """ Write the TRADE records to f, a file or file name, in .npy format
+        """
+        numpy.save(f, self.array)
+
+    @classmethod
+    def load(cls, f, stock=None):
+        """ Ledger of the trades dumped to f, of stock """
+        records = numpy.load(f)
+        result = cls(stock=stock)
+        result._record(records['tick'], records['side'], records['price'],
+                       records['volume'])
+        return result
+
+    def count(self, tick_index):
+        """ number of trades from start to tick_index, O(1) at the last tick """
+        if self._last is None or tick_index >= self._last:
+            return self._size
+        return int(self.array['tick'].searchsorted(tick_index, 'right'))
+
+    def position(self, tick_index):
+        """ numeric position at tick_index """
+        return self._positions.item(self.count(tick_index))
+
+    def gross(self, tick_index):
+        """ gross pnl from start to tick_index """
+        return self._gross.item(self.count(tick_index))
+
+    def cost(self, tick_index, function):
+        """ trading cost from start to tick_index for the cost function """
+        return self._update_costs(function).item(self.count(tick_index))
+
+    def at(self, tick_indices, function):
+        """ position, gross pnl and trading cost arrays at tick_indices """
+        counts = numpy.searchsorted(self.array['tick'], tick_indices,
+                                    side='right')
+        costs = self._update_costs(function)
+        return (self._positions[counts], self._gross[counts], costs[counts])
+
+    def trade_costs(self, function, start=0):
+        """ array of the cost of each trade from the start-th one """
+        trades = self.array[start:]
+        return trade_costs(function, numpy.abs(trades['price']),
+                           trades['volume'])
+
+    def _update_costs(self, function):
+        """ accumulated trading costs, extended with the latest trades
+
+        Returns a buffer whose first len(self) + 1 values are the costs.
+
+        The costs are recomputed when the cost function is replaced or, for a
+        Cost, when its parameters change. The cost of each trade is kept in
+        its record.
+        """
+        key = function.key if isinstance(function, Cost) else function
+        if key != self._cost_key:
+            self._cost_key = key
+            self._cost_count = 0
+        start, size = self._cost_count, self._size
+        if start < size:
+            costs = self.trade_costs(function, start)
+            self._records['cost'][start:size] = costs
+            self._costs = reserve(self._costs, size + 1)
+            self._costs[start + 1:size + 1] = numpy.cumsum(
+                numpy.concatenate((self._costs[start:start + 1], costs)))[1:]
+            self._cost_count = size
+        return self._costs
+
+
 class BackTest(object):
     """ Callable object running back tests for a strategy over a stock
 
@@ -26,26 +307,132 @@ class BackTest(object):
     >>> backtest.cost = lambda trade: 0.5 * trade / 100
     >>> backtest #doctest: +SKIP
     BackTest(trades=[99], position=short, gross=1253.63, net=435.78005)
+
+    A Cost (cf. lib/cost.py) models fixed fees, basis points, slippage and a
+    minimum ticket and is applied to all the trades at once, the function is
+    called for each trade.
+
+    >>> backtest.cost = Cost(bps=50)
     """
 
     sell = {'long': None, None: 'short'}
     buy = {None: 'long', 'short': None}
+    positions = {1: 'long', 0: None, -1: 'short'}
+    signal = {'buy': 1, 'sell': -1}
 
     def __init__(self):
-        self.cost = lambda trade: 0
+        self.cost = Cost()
         self.stock = None
         self.strategy = None
         self.trades = []
+        self._signals = None
+
+    @property
+    def trades(self):
+        """ Ledger of the trades, lists assigned to it are converted """
+        return self._trades
+
+    @trades.setter
+    def trades(self, trades):
+        self._trades = Ledger(trades, self.stock)
 
     def __call__(self, stock, strategy):
+        """ Back test strategy over stock
+
+        The signal of the strategy for each tick is generated first and kept
+        in self.signals, then the signals are executed into trades (cf.
+        execute). Strategies with a signals method (cf. strategy/__init__.py)
+        are run once over the whole stock, others are called once per tick.
+        """
+        self.stock = stock
+        self.strategy = strategy
+        self.trades = []
+        if hasattr(strategy, 'signals'):
+            self._signals = numpy.zeros(len(stock), dtype='i1')
+            for start, signals in self._chunks(stock, strategy):
+                self._signals[start:start + len(signals)] = signals
+        else:
+            self._signals = numpy.fromiter(
+                (BackTest.signal.get(strategy(t), 0) for t in stock),
+                dtype='i1', count=len(stock))
+        self._execute()
+        return self
+
+    @property
+    def signals(self):
+        """ 1 (buy), -1 (sell) or 0 (None) signal of the strategy per tick
+
+        None if the back test wasn't run, e.g. loaded from lib.results.
+        """
+        if self._signals is None:
+            return None
+        return self._signals[:len(self.stock)]
+
+    def _execute(self):
+        """ Record the trades of the signals, executed by chunks of ticks """
+        signals = self.signals
+        chunk = getattr(self.stock, 'chunk', None) or max(len(signals), 1)
+        position = 0
+        for start in xrange(0, len(signals), chunk):
+            indices, sides = execute(signals[start:start + chunk], position)
+            position += int(sides.sum())
+            self.trades.record(self.stock, start + indices, sides)
+
+    def _chunks(self, stock, strategy):
+        """ Iterator of (start, signals) of consecutive chunks of stock
+
+        Strategies with a warmup attribute, the number of ticks before a tick
+        its signal depends on, get the signals of stocks longer than
+        stock.chunk computed by chunks from windows with their own
+        indicators, so that memory stays bounded.
+        """
+        warmup = getattr(strategy, 'warmup', None)
+        chunk = getattr(stock, 'chunk', None)
+        if warmup is None or chunk is None or len(stock) <= chunk:
+            yield 0, strategy.signals(stock)
+            return
+        for start in xrange(0, len(stock), chunk):
+            begin = max(0, start - warmup)
+            window = stock.window(begin, start + chunk, shared=False)
+            yield start, strategy.signals(window)[start - begin:]
+
+    def stream(self, stock, strategy, bars):
+        """ Back test strategy while bars are appended one at a time to stock
+
+        Generator yielding the back test after each bar of the bars iterable,
+        e.g. a live feed or a replay of another Stock (cf. Stock.bars). The
+        stock indicators are extended, the strategy is called on the new tick
+        only and position, gross and net are read from the end of the ledger.
+        Bars already in stock are not traded.
+
+        Each bar costs O(n) rather than O(1) for indicators over n days: the
+        mean and std of the last window are reduced exactly like numpy.mean
+        and numpy.std, so the stream matches a batch run to the bit, which
+        running sums would not.
+
+        >>> live = BackTest().stream(Stock(), bollinger, goog.bars()) #doctest: +SKIP
+        >>> for backtest in live: #doctest: +SKIP
+        ...     print backtest.position, backtest.net
+        """
         self.stock = stock
         self.strategy = strategy
         self.trades = []
-        for t in stock:
-            if strategy(t) == 'buy' and self.position != 'long':
-                self.trades.append(Trade('buy', t))
-            elif strategy(t) == 'sell' and self.position != 'short':
-                self.trades.append(Trade('sell', t))
+        self._signals = numpy.zeros(len(stock), dtype='i1')
+        stock.rolling  # computed now so that appends extend it
+        for bar in bars:
+            stock.append(bar)
+            yield self.step()
+
+    def step(self):
+        """ Apply the strategy to the last tick of the stock """
+        tick = self.stock[-1]
+        order = self.strategy(tick)
+        self._signals = append_to(self._signals, len(self.stock) - 1,
+                                  BackTest.signal.get(order, 0))
+        if order == 'buy' and self.position != 'long':
+            self.trades.append(Trade('buy', tick))
+        elif order == 'sell' and self.position != 'short':
+            self.trades.append(Trade('sell', tick))
         return self
 
     def __repr__(self):
@@ -57,10 +444,22 @@ net={0.net})'.format(self, len(self.trades))
         """ trade cost for the backtest period """
         return self._trade_cost(len(self.stock) - 1)
 
+    def sensitivity(self, costs):
+        """ Array of the net pnl for each cost model of costs
+
+        The trades are reused, only the costs are computed for each model.
+
+        >>> backtest.sensitivity([Cost(bps=bps) for bps in (0, 10, 50)]) #doctest: +SKIP
+        array([1253.63, 1208.14, 1026.18])
+        """
+        tick_index = len(self.stock) - 1
+        net = self._net(tick_index) + self._trade_cost(tick_index)
+        return numpy.array([net - self.trades.trade_costs(cost).sum()
+                            for cost in costs])
+
     def _trade_cost(self, tick_index):
         """ trade cost from start to tick_index """
-        return sum(self.cost(abs(trade.tick.close)) for trade in self.trades
-                   if trade.tick.index <= tick_index)
+        return self.trades.cost(tick_index, self.cost)
 
     @property
     def gross(self):
@@ -69,9 +468,7 @@ net={0.net})'.format(self, len(self.trades))
 
     def _gross(self, tick_index):
         """ gross pnl from start to tick_index """
-        sign = lambda trade: 1 if trade.order == 'sell' else -1
-        return sum(sign(trade) * trade.tick.close for trade in self.trades
-                   if trade.tick.index <= tick_index)
+        return self.trades.gross(tick_index)
 
     @property
     def net(self):
@@ -81,10 +478,11 @@ net={0.net})'.format(self, len(self.trades))
     def _net(self, tick_index):
         """ net pnl from start to tick_index """
         result = 0
-        if self._position(tick_index) == 'long':
-            result += self.stock[tick_index].close
-        elif self._position(tick_index) == 'short':
-            result -= self.stock[tick_index].close
+        position = self._position(tick_index, True)
+        if position == 1:
+            result += self.stock.close.item(tick_index)
+        elif position == -1:
+            result -= self.stock.close.item(tick_index)
         result += self._gross(tick_index)
         result -= self._trade_cost(tick_index)
         return result
@@ -96,24 +494,20 @@ net={0.net})'.format(self, len(self.trades))
 
     def _position(self, tick_index, numeric_flag=False):
         """ position at tick_index 1/0/-1 if numeric_flag """
-        position_ = {1: 'long', 0: None, -1: 'short'}
-        counter = Counter(trade.order for trade in self.trades
-                          if trade.tick.index <= tick_index)
-        numeric = counter['buy'] - counter['sell']
+        numeric = self.trades.position(tick_index)
         if numeric_flag:
             return numeric
-        return position_[counter['buy'] - counter['sell']]
+        return BackTest.positions[numeric]
 
     def plot(self):
-        date = [tick.date for tick in self.stock]
-        net = [self._net(tick.index) for tick in self.stock]
-        position = [self._position(tick.index, True) for tick in self.stock]
-        plot_net = subplot2grid((3, 1), (0, 0), rowspan=2)
-        plot(date, net)
-        plot_position = subplot2grid((3, 1), (2, 0), sharex=plot_net)
-        ylim(-1.5, 1.5)
-        yticks((-1, 0, 1), ('short', '...', 'long'))
-        fill_between(date, position)
-        savefig('png/{0}_{1}.png'.format(self.stock.symbol,
-                                     self.strategy.__class__.__name__))
-        clf()
+        """ Save a plot of the net pnl and the position under png/ """
+        plot.backtest(*self.chart()[1])
+
+    def chart(self):
+        """ (function, arguments) rendering the plot, cf. lib.plot.render_many """
+        position, gross, cost = self.trades.at(numpy.arange(len(self.stock)),
+                                               self.cost)
+        net = gross - cost + position * self.stock.close
+        return plot.backtest, ('png/{0}_{1}.png'.format(
+            self.stock.symbol, self.strategy.__class__.__name__),
+            self.stock.date, net, position)
@@ -0,0 +1,60 @@
+import numpy
+
+
+class Cost(object):
+    """ Trading cost model applied to arrays of trade amounts at once
+
+    The cost of a trade is a fixed fee, plus bps basis points of the amount,
+    plus a slippage growing with the amount over the square root of the
+    volume traded that day, and at least the minimum ticket.
+
+    >>> cost = Cost(fixed=1, bps=10, minimum=1.5)
+    >>> cost(numpy.array([100.0, 1000.0])).tolist()
+    [1.5, 2.0]
+    >>> Cost(slippage=1)(100.0, 10000)
+    1.0
+
+    Without a volume, e.g. when called with a single amount like the legacy
+    BackTest.cost functions, there is no slippage.
+    """
+
+    def __init__(self, fixed=0, bps=0, slippage=0, minimum=0):
+        self.fixed = fixed
+        self.bps = bps
+        self.slippage = slippage
+        self.minimum = minimum
+
+    def __repr__(self):
+        return 'Cost(fixed={0.fixed}, bps={0.bps}, slippage={0.slippage}, \
+minimum={0.minimum})'.format(self)
+
+    @property
+    def key(self):
+        """ parameters of the model, costs computed with other keys are stale """
+        return (self.fixed, self.bps, self.slippage, self.minimum)
+
+    def __call__(self, amount, volume=None):
+        amount = numpy.asarray(amount, dtype='f8')
+        cost = self.fixed + self.bps * 1e-4 * amount
+        if self.slippage and volume is not None:
+            volume = numpy.asarray(volume, dtype='f8')
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                impact = amount / numpy.sqrt(volume)
+            cost = cost + self.slippage * numpy.where(volume > 0, impact, 0.0)
+        return numpy.maximum(cost, self.minimum)[()]
+
+
+def trade_costs(function, amounts, volumes):
+    """ Array of the cost of each trade for a Cost or a legacy function
+
+    A Cost is applied to the whole arrays, a legacy function taking a trade
+    amount is called for each trade.
+
+    >>> trade_costs(lambda trade: 0.5 * trade / 100, [100.0, 200.0], [1, 1])
+    array([0.5, 1. ])
+    """
+    if isinstance(function, Cost):
+        return numpy.zeros(len(amounts)) + function(amounts, volumes)
+    return numpy.array([function(amount)
+                        for amount in numpy.asarray(amounts).tolist()],
+                       dtype='f8')
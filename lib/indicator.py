@@ -0,0 +1,488 @@
+import ast
+import re
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+
+# values reduced at once by the rolling windows, bounding their memory
+_CELLS = 2 ** 16
+
+
+def append_to(buffer, size, value):
+    """ buffer holding value at index size, reallocated twice as large if full
+
+    Appending one value at a time to a buffer is O(1) amortized.
+    """
+    if size == len(buffer):
+        buffer = reserve(buffer, size + 1)
+    buffer[size] = value
+    return buffer
+
+
+def prepend_to(buffer, size, values):
+    """ buffer holding values before its last size values, reallocated at
+    least twice as large if too small
+
+    The values are filled from the end of the buffer, so prepending blocks
+    of values is O(1) amortized per value.
+
+    >>> prepend_to(numpy.array([0.0, 3.0]), 1, [1.0, 2.0])[-3:].tolist()
+    [1.0, 2.0, 3.0]
+    """
+    end = len(buffer) - size
+    if len(values) > end:
+        grown = numpy.empty((max(16, 2 * len(buffer), size + len(values)),) +
+                            buffer.shape[1:], dtype=buffer.dtype)
+        grown[len(grown) - size:] = buffer[end:]
+        buffer = grown
+        end = len(buffer) - size
+    buffer[end - len(values):end] = values
+    return buffer
+
+
+def reserve(buffer, size):
+    """ buffer with room for size values, reallocated at least twice as large
+    if too small """
+    if size > len(buffer):
+        grown = numpy.empty((max(16, 2 * len(buffer), size),) +
+                            buffer.shape[1:], dtype=buffer.dtype)
+        grown[:len(buffer)] = buffer
+        buffer = grown
+    return buffer
+
+
+class Rolling(object):
+    """ Rolling mean and standard deviation of a series
+
+    The windows are strided views of the values, summed by the operations of
+    numpy.mean and numpy.std in the same order, so the indicators match
+    theirs over a slice of the series to the last bit, ties between the close
+    and the bands included. The array of a window is computed once, then any
+    value is looked up in O(1).
+
+    >>> rolling = Rolling([4.0, 8.0, 12.0])
+    >>> rolling.ma_at(2, 2)
+    10.0
+    >>> rolling.std_at(2, 2)
+    2.0
+    >>> rolling.ma_at(0, 2)
+    nan
+
+    The result is nan until n values are available, also when n is longer
+    than the series, where numpy.mean over a slice of a list of Tick averages
+    the whole series.
+
+    values may also be a 2D array holding one series per column, in which case
+    nan values, e.g. before a stock was listed, make the windows containing
+    them nan.
+    """
+
+    # index of the first value in the values of the Rolling whose arrays are
+    # shared, for a window of a longer series, cf. window
+    start = 0
+    _parent = None
+
+    def __init__(self, values):
+        self.values = numpy.asarray(values, dtype='f8')
+        self.cache = {}
+        self._buffers = {'values': self.values}
+
+    def __len__(self):
+        return len(self.values)
+
+    def window(self, start, stop):
+        """ Rolling of values[start:stop] sharing the arrays
+
+        The windows of the first values of the slice reach back before it,
+        so the indicators are those of the whole series, sliced.
+
+        >>> Rolling([4.0, 8.0, 12.0]).window(1, 3).ma_at(0, 2)
+        6.0
+        """
+        parent = self._parent or self
+        start, stop, step = slice(start, stop).indices(len(self))
+        result = Rolling.__new__(Rolling)
+        result.start = self.start + start
+        result._parent = parent
+        result.values = self.values[start:stop]
+        result.cache = {}
+        result._buffers = {'values': result.values}
+        return result
+
+    def append(self, value):
+        """ Extend a 1D series with value in O(n) for each computed window
+
+        The computed arrays are extended with the value of their last window,
+        so the indicators match the ones of the whole series.
+        """
+        size = len(self.values)
+        buffers = self._buffers
+        buffers['values'] = append_to(buffers['values'], size, value)
+        self.values = buffers['values'][:size + 1]
+        moments = {}
+        for key in self.cache:
+            kind, n = key
+            if n not in moments:
+                moments[n] = _last_moments(self.values, n)
+            last = moments[n][kind == 'std']
+            buffers[key] = append_to(buffers.get(key, self.cache[key]), size,
+                                     last)
+            self.cache[key] = buffers[key][:size + 1]
+
+    def ma(self, n):
+        """ moving average array, computed once per window """
+        return self._indicator('ma', n)
+
+    def std(self, n):
+        """ moving standard deviation array, computed once per window """
+        return self._indicator('std', n)
+
+    def windows(self, ns):
+        """ moving average and standard deviation matrices of a 1D series
+
+        Column j holds ma(ns[j]) and std(ns[j]) respectively, without caching
+        the columns. Each column is an exact strided reduction, so the cost is
+        O(len(self) * sum(ns)), instead of the O(len(self) * len(ns)) of
+        cumulative sums, in a few array operations per window.
+
+        >>> ma, std = Rolling([4.0, 8.0, 12.0]).windows([1, 2])
+        >>> ma.tolist()
+        [[4.0, nan], [8.0, 6.0], [12.0, 10.0]]
+        """
+        if self._parent is not None:
+            ma, std = self._parent.windows(ns)
+            return ma[self.start:][:len(self)], std[self.start:][:len(self)]
+        shape = (len(self), len(ns))
+        ma = numpy.empty(shape, order='F')
+        std = numpy.empty(shape, order='F')
+        for column, n in enumerate(ns):
+            ma[:, column], std[:, column] = _moments(self.values, n)
+        return ma, std
+
+    def ma_at(self, index, n):
+        """ moving average over the n values up to and including index """
+        return float(self.ma(n)[index])
+
+    def std_at(self, index, n):
+        """ standard deviation over the n values up to and including index """
+        return float(self.std(n)[index])
+
+    def _indicator(self, kind, n):
+        """ ma or std array, the ma computed along with the std """
+        key = (kind, n)
+        if key in self.cache:
+            return self.cache[key]
+        if self._parent is not None:
+            values = self._parent._indicator(kind, n)
+            self.cache[key] = values[self.start:][:len(self)]
+        elif kind == 'std':
+            ma, self.cache[key] = _moments(self.values, n)
+            self.cache.setdefault(('ma', n), ma)
+        else:
+            self.cache[key] = _moments(self.values, n, False)[0]
+        return self.cache[key]
+
+
+def _moments(values, n, std=True):
+    """ means and standard deviations, None unless std, of the windows of n
+    values along the first axis, nan until n values are available
+
+    Each window is reduced by the operations of numpy.mean and numpy.std, in
+    the same order, over a strided view of the columns, by chunks of windows
+    holding about _CELLS values.
+    """
+    means = numpy.empty(values.shape)
+    means.fill(numpy.nan)
+    deviations = means.copy() if std else None
+    if not 0 < n <= len(values):
+        return means, deviations
+    # columns contiguous in memory, so that each window is summed like a 1D
+    # array by numpy.mean
+    columns = numpy.ascontiguousarray(values.reshape(len(values), -1).T)
+    count = len(values) - n + 1
+    windows = as_strided(columns, shape=(len(columns), count, n),
+                         strides=columns.strides + columns.strides[1:])
+    rows = max(1, _CELLS // (n * len(columns)))
+    flat_means = means.reshape(len(values), -1)
+    flat_deviations = deviations.reshape(len(values), -1) if std else None
+    for start in xrange(0, count, rows):
+        chunk = windows[:, start:start + rows]
+        mean = chunk.sum(axis=2, keepdims=True) / n
+        flat_means[n - 1 + start:][:chunk.shape[1]] = mean[:, :, 0].T
+        if std:
+            centered = chunk - mean
+            centered *= centered
+            flat_deviations[n - 1 + start:][:chunk.shape[1]] = numpy.sqrt(
+                centered.sum(axis=2) / n).T
+    return means, deviations
+
+
+def _last_moments(values, n):
+    """ mean and standard deviation of the last n values, as _moments """
+    if not 0 < n <= len(values):
+        return numpy.nan, numpy.nan
+    window = values[-n:]
+    mean = numpy.add.reduce(window) / n
+    centered = window - mean
+    centered *= centered
+    return mean, numpy.sqrt(numpy.add.reduce(centered) / n)
+
+
+def _seeded(function, values, *args):
+    """ function(values, *args) of each series from its first valid value
+
+    The series, i.e. the columns of 2D values, starting with nan values, e.g.
+    of a stock listed later in a Portfolio, are nan until their first valid
+    value and computed from it, as if they started there.
+    """
+    values = numpy.asarray(values, dtype='f8')
+    valid = ~numpy.isnan(values)
+    if not values.size or valid[0].all():
+        return function(values, *args)
+    starts = numpy.where(valid.any(axis=0), valid.argmax(axis=0), len(values))
+    result = numpy.empty(values.shape)
+    result.fill(numpy.nan)
+    if values.ndim == 1:
+        result[starts:] = function(values[starts:], *args)
+        return result
+    for start in numpy.unique(starts):
+        columns = numpy.flatnonzero(starts == start)
+        result[start:, columns] = function(values[start:, columns], *args)
+    return result
+
+
+def exponential(values, alpha):
+    """ Exponential moving average along the first axis, starting at the first
+    valid value of each series
+
+    result[t] = (1 - alpha) * result[t - 1] + alpha * values[t]
+
+    >>> exponential([1.0, 3.0, 3.0], 0.5).tolist()
+    [1.0, 2.0, 2.5]
+    >>> exponential([[numpy.nan, 1.0], [1.0, 3.0]], 0.5).tolist()
+    [[nan, 1.0], [1.0, 2.0]]
+
+    Blocks of values are smoothed at once as a cumulative sum scaled by the
+    powers of the decay, short enough for the powers to stay representable.
+    A nan value after the first valid one makes the rest of the average nan.
+    """
+    return _seeded(_exponential, values, alpha)
+
+
+def _exponential(values, alpha):
+    """ exponential moving average starting at values[0] """
+    result = numpy.empty_like(values)
+    decay = 1.0 - alpha
+    if not len(values) or decay <= 0:
+        result[:] = values
+        return result
+    block = int(min(len(values), max(1, 200 / -numpy.log(decay))))
+    powers = decay ** numpy.arange(block)
+    powers = powers.reshape((-1,) + (1,) * (values.ndim - 1))
+    previous = values[0]
+    for start in xrange(0, len(values), block):
+        chunk = values[start:start + block]
+        scale = powers[:len(chunk)]
+        result[start:start + block] = scale * (
+            decay * previous + alpha * numpy.cumsum(chunk / scale, axis=0))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+
+def _rolling_extreme(values, n, accumulate, padding):
+    """ accumulate (numpy.maximum or minimum) over the trailing n values
+
+    Prefix and suffix accumulations over blocks of n values combine into any
+    window in O(1), nan until n values are available. padding is the value
+    neutral for accumulate.
+    """
+    values = numpy.asarray(values, dtype='f8')
+    result = numpy.empty_like(values)
+    result.fill(numpy.nan)
+    if not 0 < n <= len(values):
+        return result
+    blocks = -(-len(values) // n)
+    padded = numpy.empty((blocks * n,) + values.shape[1:])
+    padded.fill(padding)
+    padded[:len(values)] = values
+    shape = (blocks, n) + values.shape[1:]
+    prefix = accumulate.accumulate(padded.reshape(shape), axis=1)
+    suffix = accumulate.accumulate(padded.reshape(shape)[:, ::-1], axis=1)
+    prefix = prefix.reshape(padded.shape)[:len(values)]
+    suffix = suffix[:, ::-1].reshape(padded.shape)
+    result[n-1:] = accumulate(suffix[:len(values) - n + 1], prefix[n-1:])
+    return result
+
+
+def _wilder(values, n):
+    """ Wilder average over n values, seeded with the mean of the first n
+    valid values of each series """
+    return _seeded(_wilder_average, values, n)
+
+
+def _wilder_average(values, n):
+    """ Wilder average over n values, seeded with the mean of values[:n] """
+    result = numpy.empty(values.shape)
+    result.fill(numpy.nan)
+    if 0 < n <= len(values):
+        seeded = numpy.concatenate((values[:n].mean(axis=0)[None],
+                                    values[n:]))
+        result[n-1:] = _exponential(seeded, 1.0 / n)
+    return result
+
+
+def ema(series, n):
+    """ exponential moving average of the close over about n days """
+    return exponential(series.close, 2.0 / (n + 1))
+
+
+def rsi(series, n):
+    """ relative strength index of the close over n days, from 0 to 100 """
+    changes = numpy.diff(series.close, axis=0)
+    result = numpy.empty(series.close.shape)
+    result.fill(numpy.nan)
+    gains = _wilder(numpy.maximum(changes, 0), n)
+    losses = _wilder(numpy.maximum(-changes, 0), n)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        result[1:] = numpy.where(losses > 0, 100 - 100 / (1 + gains / losses),
+                                 numpy.where(gains > 0, 100.0, 50.0))
+    result[1:][numpy.isnan(gains)] = numpy.nan
+    return result
+
+
+def atr(series, n):
+    """ average true range over n days """
+    previous = numpy.concatenate((series.close[:1], series.close[:-1]))
+    # the true range of the first day of a series is its high - low
+    previous = numpy.where(numpy.isnan(previous), series.close, previous)
+    true_range = numpy.maximum(series.high, previous) - \
+        numpy.minimum(series.low, previous)
+    return _wilder(true_range, n)
+
+
+def rolling_min(series, n):
+    """ lowest close over n days """
+    return _rolling_extreme(series.close, n, numpy.minimum, numpy.inf)
+
+
+def rolling_max(series, n):
+    """ highest close over n days """
+    return _rolling_extreme(series.close, n, numpy.maximum, -numpy.inf)
+
+
+# indicator functions by name, called with the Indicators object and the
+# parameters of the indicator, add an entry to define a new indicator
+INDICATORS = {
+    'ma': lambda series, n: series.rolling.ma(n),
+    'std': lambda series, n: series.rolling.std(n),
+    'upper_bb': lambda series, n, k: series.ma(n) + k * series.std(n),
+    'lower_bb': lambda series, n, k: series.ma(n) - k * series.std(n),
+    'ema': ema,
+    'rsi': rsi,
+    'atr': atr,
+    'rolling_min': rolling_min,
+    'rolling_max': rolling_max,
+}
+
+
+def parse(expression):
+    """ Name and parameters of an indicator expression
+
+    >>> parse('upper_bb(30, 1)')
+    ('upper_bb', (30, 1))
+    >>> parse('close')
+    ('close', ())
+    """
+    match = re.match(r'\s*(\w+)\s*(?:\((.*)\))?\s*$', expression)
+    if match is None:
+        raise ValueError('invalid indicator {0!r}'.format(expression))
+    name, parameters = match.groups()
+    if not parameters or not parameters.strip():
+        return name, ()
+    return name, tuple(ast.literal_eval('({0},)'.format(parameters)))
+
+
+class Indicators(object):
+    """ Indicator arrays of an object with close, high and low arrays
+
+    Indicators are evaluated over the whole series and memoized by name and
+    parameters, so indicators built on others, like the Bollinger bands on
+    ma and std, share them.
+
+    >>> stock.evaluate('upper_bb(30, 1)') #doctest: +SKIP
+    array([nan, nan, ..., 612.34])
+    >>> stock.lower_bb(30, 1) is stock.evaluate('lower_bb(30, 1.0)') #doctest: +SKIP
+    True
+
+    Cf. INDICATORS for the available indicators.
+    """
+
+    _rolling = None
+    _values = None
+    # (Indicators, start) of which this is a window, cf. Stock.window
+    _parent = None
+
+    @property
+    def rolling(self):
+        """ Rolling indicators of the close, computed once """
+        if self._rolling is None and self._parent is not None:
+            parent, start = self._parent
+            self._rolling = parent.rolling.window(start, start + len(self))
+        elif self._rolling is None:
+            self._rolling = Rolling(self.close)
+        return self._rolling
+
+    def evaluate(self, expression):
+        """ Array of an indicator expression like 'ma(30)', or of a column """
+        name, parameters = parse(expression)
+        if name not in INDICATORS and not parameters:
+            return getattr(self, name)
+        return self.indicator(name, *parameters)
+
+    def indicator(self, name, *parameters):
+        """ Array of the indicator name for parameters, computed once """
+        key = (name,) + parameters
+        if self._values is not None and key in self._values:
+            return self._values[key]
+        if self._parent is not None:
+            parent, start = self._parent
+            values = parent.indicator(name, *parameters)
+            values = values[start:start + len(self)]
+        elif name not in INDICATORS:
+            raise KeyError('unknown indicator {0!r}'.format(name))
+        else:
+            values = INDICATORS[name](self, *parameters)
+        # set after computing, which may load the columns of a lazy stock
+        if self._values is None:
+            self._values = {}
+        return self._values.setdefault(key, values)
+
+    def ma(self, n):
+        """ n days moving average of the close for every tick """
+        return self.indicator('ma', n)
+
+    def std(self, n):
+        """ n days standard deviation of the close for every tick """
+        return self.indicator('std', n)
+
+    def upper_bb(self, n, k):
+        return self.indicator('upper_bb', n, k)
+
+    def lower_bb(self, n, k):
+        return self.indicator('lower_bb', n, k)
+
+    def ema(self, n):
+        return self.indicator('ema', n)
+
+    def rsi(self, n):
+        return self.indicator('rsi', n)
+
+    def atr(self, n):
+        return self.indicator('atr', n)
+
+    def rolling_min(self, n):
+        return self.indicator('rolling_min', n)
+
+    def rolling_max(self, n):
+        return self.indicator('rolling_max', n)
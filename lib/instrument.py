@@ -0,0 +1,223 @@
+""" Opt-in counters and timers around the hot paths, and profiling hooks
+
+Nothing is measured until enable() wraps the instrumented functions, and
+disable() puts the original functions back, so the instrumentation costs
+nothing when disabled.
+
+>>> from lib import instrument
+>>> instrument.enable() #doctest: +SKIP
+>>> backtest = BackTest()(Stock('GOOG'), Bollinger(30, 1)) #doctest: +SKIP
+>>> backtest.stats['tick.std'] #doctest: +SKIP
+{'calls': 1958, 'seconds': 0.0041}
+>>> instrument.dump(open('stats.json', 'w')) #doctest: +SKIP
+>>> instrument.disable() #doctest: +SKIP
+
+Timers are inclusive: the time of Stock.load includes the time of the cache
+I/O it does. Each back test run records in its stats attribute the calls
+made while it ran, strategy and Tick indicator calls included, and the calls
+of its pnl properties afterwards. In a sweep the counters are those of each
+worker process.
+"""
+
+import cProfile
+import json
+import signal
+import time
+import types
+from contextlib import contextmanager
+
+import store
+from backtest import BackTest
+from results import HEAPTYPE
+from stock import Stock
+from tick import Tick
+
+
+# (name, owner, attribute) of the instrumented functions
+STAGES = [
+    ('stock.load', Stock, 'load'),
+    ('stock.update_cache', Stock, 'update_cache'),
+    ('stock.parse', Stock, 'parse'),
+    ('stock.cast', Stock, 'cast'),
+    ('cache.load', store, 'load'),
+    ('cache.save', store, 'save'),
+    ('cache.append', store, 'append'),
+    ('tick.ma', Tick, 'ma'),
+    ('tick.std', Tick, 'std'),
+    ('tick.upper_bb', Tick, 'upper_bb'),
+    ('tick.lower_bb', Tick, 'lower_bb'),
+    ('backtest.run', BackTest, '__call__'),
+    ('backtest.position', BackTest, 'position'),
+    ('backtest.gross', BackTest, 'gross'),
+    ('backtest.net', BackTest, 'net'),
+    ('backtest.trade_cost', BackTest, 'trade_cost'),
+]
+
+# name: [calls, seconds]
+_counters = {}
+# (owner, attribute, original, own) of the installed wrappers
+_installed = []
+
+
+def enabled():
+    return bool(_installed)
+
+
+def enable():
+    """ Reset the counters and install the wrappers """
+    reset()
+    if enabled():
+        return
+    for name, owner, attribute in STAGES:
+        wrapper = _run if name == 'backtest.run' else _timed
+        _wrap(owner, attribute, name, wrapper)
+
+
+def disable():
+    """ Put the original functions back """
+    while _installed:
+        owner, attribute, original, own = _installed.pop()
+        if own:
+            setattr(owner, attribute, original)
+        else:
+            delattr(owner, attribute)
+
+
+def reset():
+    _counters.clear()
+
+
+def counters():
+    """ {name: {'calls': calls, 'seconds': seconds}} of the calls so far """
+    return _as_dict(_counters)
+
+
+def dump(f, backtest=None):
+    """ Write the counters, and the stats of backtest if given, as JSON """
+    report = {'counters': counters()}
+    if backtest is not None:
+        report['backtest'] = getattr(backtest, 'stats', {})
+    json.dump(report, f, indent=1, sort_keys=True)
+
+
+def _as_dict(counts):
+    return dict((name, {'calls': calls, 'seconds': seconds})
+                for name, (calls, seconds) in counts.items())
+
+
+def _timed(name, function):
+    """ function counting its calls and time under name """
+    def timed(*args, **kwargs):
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            counter = _counters.setdefault(name, [0, 0.0])
+            counter[0] += 1
+            counter[1] += elapsed
+            backtest = args[0] if args else None
+            stats = getattr(backtest, 'stats', None)
+            if isinstance(backtest, BackTest) and isinstance(stats, dict):
+                stat = stats.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                stat['calls'] += 1
+                stat['seconds'] += elapsed
+    timed.instrumented = True
+    return timed
+
+
+def _run(name, function):
+    """ BackTest.__call__ recording the calls made by the run in stats """
+    def run(backtest, stock, strategy):
+        before = dict((key, list(value)) for key, value in _counters.items())
+        result = function(backtest, stock, _strategy(strategy))
+        stats = {}
+        for key, (calls, seconds) in _counters.items():
+            previous = before.get(key, [0, 0.0])
+            if calls > previous[0]:
+                stats[key] = [calls - previous[0], seconds - previous[1]]
+        backtest.stats = _as_dict(stats)
+        return result
+    return _timed(name, run)
+
+
+def _strategy(strategy):
+    """ strategy with its calls and signals timed
+
+    The methods of strategy objects are wrapped on their class, until
+    disable(), other callables, e.g. functions or instances of classes
+    defined in C like functools.partial, are wrapped themselves.
+    """
+    cls = type(strategy)
+    if isinstance(strategy, types.FunctionType) or \
+            not cls.__flags__ & HEAPTYPE:
+        if getattr(strategy, 'instrumented', False):
+            return strategy
+        return _timed('strategy.call', strategy)
+    for name, attribute in (('strategy.call', '__call__'),
+                            ('strategy.signals', 'signals')):
+        defined = any(attribute in vars(base) for base in cls.__mro__)
+        if defined and not getattr(getattr(cls, attribute), 'instrumented',
+                                   False):
+            _wrap(cls, attribute, name)
+    return strategy
+
+
+def _wrap(owner, attribute, name, wrapper=_timed):
+    """ replace attribute of owner, a class or module, by its timed version """
+    classes = getattr(owner, '__mro__', (owner,))
+    cls = next(cls for cls in classes if attribute in vars(cls))
+    original = vars(cls)[attribute]
+    own = cls is owner
+    if isinstance(original, staticmethod):
+        wrapped = staticmethod(wrapper(name, original.__func__))
+    elif isinstance(original, classmethod):
+        wrapped = classmethod(wrapper(name, original.__func__))
+    elif isinstance(original, property):
+        wrapped = property(wrapper(name, original.fget), original.fset)
+    else:
+        wrapped = wrapper(name, original)
+    setattr(owner, attribute, wrapped)
+    _installed.append((owner, attribute, original, own))
+
+
+@contextmanager
+def profiled(filename=None):
+    """ Profile the block with cProfile, yield the cProfile.Profile
+
+    The statistics are dumped to filename if given, for pstats or snakeviz.
+
+    >>> with profiled('backtest.prof') as profile: #doctest: +SKIP
+    ...     BackTest()(goog, Bollinger(30, 1))
+    >>> pstats.Stats(profile).sort_stats('time').print_stats(10) #doctest: +SKIP
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if filename is not None:
+            profile.dump_stats(filename)
+
+
+@contextmanager
+def sampled(interval=0.001):
+    """ Sample the running function every interval seconds of CPU time
+
+    Yields a dict counting the samples by (file name, line, function) of the
+    running frame, cheaper than cProfile on long runs.
+    """
+    samples = {}
+
+    def sample(signum, frame):
+        key = (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+        samples[key] = samples.get(key, 0) + 1
+
+    previous = signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        yield samples
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, previous)
@@ -0,0 +1,152 @@
+""" Monte Carlo back tests of random strategies and resampled prices
+
+A null distribution of the net pnl, i.e. what chance alone makes, is built
+either by back testing thousands of seeded random strategies over a stock or
+by back testing a strategy over thousands of price paths resampled by blocks
+of the stock returns. Each batch of runs is a single numpy computation over a
+dates x runs matrix of signals (cf. backtest.execute_columns) and the batches
+are spread over a process pool (cf. sweep.pool_map).
+
+>>> chance = seeded(partial(Monkey, 30), goog, runs=10000) #doctest: +SKIP
+>>> chance.percentiles #doctest: +SKIP
+{5: -412.3, 25: -151.8, 50: 3.1, 75: 160.5, 95: 408.9}
+>>> rank(BackTest()(goog, Bollinger(30, 1)).net, chance.net) #doctest: +SKIP
+93.4
+"""
+
+from collections import namedtuple
+
+import numpy
+
+from backtest import pnl_columns
+from cost import Cost
+from indicator import Indicators
+from sweep import pool_map
+
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+Distribution = namedtuple('Distribution', ['net', 'percentiles'])
+
+
+def distribution(net, q=PERCENTILES):
+    """ Distribution of the net pnl array with its q percentiles by q
+
+    >>> distribution(numpy.arange(101.0), (5, 50)).percentiles
+    {50: 50.0, 5: 5.0}
+    """
+    net = numpy.asarray(net)
+    percentiles = [numpy.nan] * len(q)
+    if len(net):
+        percentiles = numpy.percentile(net, q).tolist()
+    return Distribution(net, dict(zip(q, percentiles)))
+
+
+def rank(value, net):
+    """ percentage of the net pnl array strictly below value
+
+    >>> rank(2.5, [1, 2, 3, 4])
+    50.0
+    """
+    net = numpy.asarray(net)
+    return 100.0 * numpy.count_nonzero(net < value) / max(len(net), 1)
+
+
+def net_pnl(close, signals, cost, volume=None):
+    """ Net pnl of each column of signals traded at close, as BackTest.net
+
+    close is the price array shared by the columns or a matrix holding the
+    prices of each column, volume likewise or None, cf. pnl_columns.
+    """
+    return pnl_columns(close, signals, cost, volume)[3]
+
+
+def _batches(runs, batch):
+    return [(start, min(start + batch, runs))
+            for start in xrange(0, runs, batch)]
+
+
+def _seeded(context, task):
+    factory, stock, seed, cost = context
+    start, stop = task
+    signals = numpy.column_stack(
+        [factory(seed=seed + index).signals(stock)
+         for index in xrange(start, stop)])
+    return net_pnl(stock.close, signals, cost, stock.volume)
+
+
+def seeded(factory, stock, runs=1000, seed=0, cost=None, batch=250,
+           processes=None):
+    """ Distribution of the net pnl of runs random strategies over stock
+
+    factory(seed=seed + i) returns the strategy of the i-th run, e.g.
+    functools.partial(Monkey, 30), which must implement the vectorized
+    protocol (cf. strategy/__init__.py). BackTest()(stock, factory(seed=...))
+    reproduces a run.
+    """
+    len(stock)  # a lazy stock is loaded once, before the workers start
+    context = (factory, stock, seed, Cost() if cost is None else cost)
+    nets = pool_map(_seeded, _batches(runs, batch), context, processes)
+    return distribution(numpy.concatenate(nets or [[]]))
+
+
+class Paths(Indicators):
+    """ Close prices of many price paths, one per column, with their indicators
+
+    Vectorized strategies (cf. strategy/__init__.py) compute their signals
+    for all the paths at once from the close, ma, std, etc. matrices.
+    """
+
+    def __init__(self, date, close):
+        self.date = date
+        self.close = close
+
+    def __len__(self):
+        return len(self.date)
+
+
+def bootstrap(stock, paths=1000, block=20, seed=0):
+    """ Paths of close prices resampled by blocks of the stock returns
+
+    Each path starts at the first close of the stock and follows blocks of
+    block consecutive daily log returns drawn at random, path i from a
+    RandomState seeded with seed + i.
+
+    >>> bootstrap(goog, 1000).close.shape #doctest: +SKIP
+    (1958, 1000)
+    """
+    returns = numpy.diff(numpy.log(stock.close))
+    if not len(returns):
+        return Paths(stock.date, numpy.repeat(stock.close[:, None], paths, 1))
+    block = max(1, min(block, len(returns)))
+    blocks = -(-len(returns) // block)
+    starts = numpy.array([numpy.random.RandomState(seed + index)
+                          .randint(0, len(returns) - block + 1, blocks)
+                          for index in xrange(paths)]).reshape(paths, blocks)
+    indices = (starts[:, :, None] + numpy.arange(block)).reshape(paths, -1)
+    resampled = returns[indices[:, :len(returns)].T]
+    close = numpy.empty((len(stock), paths))
+    close[:1] = stock.close[:1]
+    close[1:] = stock.close[0] * numpy.exp(numpy.cumsum(resampled, axis=0))
+    return Paths(stock.date, close)
+
+
+def _paths(context, task):
+    stock, strategy, block, seed, cost = context
+    start, stop = task
+    paths = bootstrap(stock, stop - start, block, seed + start)
+    return net_pnl(paths.close, strategy.signals(paths), cost)
+
+
+def simulate(strategy, stock, paths=1000, block=20, seed=0, cost=None,
+             batch=100, processes=None):
+    """ Distribution of the net pnl of strategy over bootstrapped paths
+
+    strategy must implement the vectorized protocol (cf.
+    strategy/__init__.py), paths only have a close so the cost is computed
+    without slippage.
+    """
+    len(stock)  # a lazy stock is loaded once, before the workers start
+    context = (stock, strategy, block, seed, Cost() if cost is None else cost)
+    nets = pool_map(_paths, _batches(paths, batch), context, processes)
+    return distribution(numpy.concatenate(nets or [[]]))
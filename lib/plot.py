@@ -0,0 +1,126 @@
+""" Headless rendering of precomputed arrays into PNG files
+
+Figures are built with the object oriented matplotlib API on the Agg canvas,
+without pyplot and its global state, so they can be rendered in worker
+processes. Series longer than the figure is wide are decimated to the minimum
+and maximum of each pixel column, which draws the same picture.
+
+matplotlib is imported by the first rendering, so importing the library, e.g.
+in sweep workers, doesn't pay for it.
+"""
+
+from multiprocessing import Pool, cpu_count
+
+import numpy
+
+
+SIZE = (8, 6)
+DPI = 100
+
+
+def dates(date):
+    """ matplotlib date numbers of a datetime64 array """
+    from matplotlib.dates import date2num
+    return date2num(numpy.asarray(date))
+
+
+def decimate(x, y, width):
+    """ x and y reduced to the first, lowest, highest and last y of buckets
+
+    There are about width buckets, series shorter than 5 width are kept.
+
+    >>> x, y = decimate(numpy.arange(8), numpy.array([3, 5, 1, 2, 7, 3, 4, 6]), 1)
+    >>> x.tolist(), y.tolist()
+    ([0, 2, 4, 7], [3, 1, 7, 6])
+    >>> len(decimate(numpy.arange(8), numpy.arange(8), 2)[0])
+    8
+    """
+    x, y = numpy.asarray(x), numpy.asarray(y)
+    step = len(y) // max(width, 1)
+    if step <= 4:
+        return x, y
+    size = len(y) // step * step
+    shape = (size // step, step)
+    blocks = numpy.where(numpy.isnan(y[:size]), numpy.inf, y[:size])
+    low = blocks.reshape(shape).argmin(axis=1)
+    blocks = numpy.where(numpy.isnan(y[:size]), -numpy.inf, y[:size])
+    high = blocks.reshape(shape).argmax(axis=1)
+    starts = numpy.arange(0, size, step)
+    indices = numpy.concatenate((starts, starts + low, starts + high,
+                                 starts + step - 1, numpy.arange(size, len(y))))
+    indices = numpy.unique(indices)
+    return x[indices], y[indices]
+
+
+def figure():
+    """ Figure drawn on its own Agg canvas """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    result = Figure(figsize=SIZE, dpi=DPI)
+    FigureCanvasAgg(result)
+    return result
+
+
+def _date_axis(axes):
+    from matplotlib.dates import AutoDateLocator, AutoDateFormatter
+    locator = AutoDateLocator()
+    axes.xaxis.set_major_locator(locator)
+    axes.xaxis.set_major_formatter(AutoDateFormatter(locator))
+
+
+def lines(filename, date, series):
+    """ Save a plot of the (label, values) series against date in filename """
+    result = figure()
+    axes = result.add_subplot(1, 1, 1)
+    x = dates(date)
+    width = SIZE[0] * DPI
+    for label, values in series:
+        axes.plot(*decimate(x, values, width), label=label)
+    _date_axis(axes)
+    result.savefig(filename)
+
+
+def backtest(filename, date, net, position):
+    """ Save a plot of the net pnl above the position in filename """
+    from matplotlib.gridspec import GridSpec
+    result = figure()
+    x = dates(date)
+    width = SIZE[0] * DPI
+    grid = GridSpec(3, 1)
+    net_axes = result.add_subplot(grid[:2, 0])
+    net_axes.plot(*decimate(x, net, width))
+    position_axes = result.add_subplot(grid[2, 0], sharex=net_axes)
+    position_axes.set_ylim(-1.5, 1.5)
+    position_axes.set_yticks((-1, 0, 1))
+    position_axes.set_yticklabels(('short', '...', 'long'))
+    position_axes.fill_between(*decimate(x, position, width))
+    _date_axis(position_axes)
+    result.savefig(filename)
+
+
+def _render(chart):
+    function, args = chart
+    function(*args)
+    return args[0]
+
+
+def render_many(charts, processes=None):
+    """ Render the (function, args) charts in worker processes
+
+    function is lines or backtest and args its arguments, starting with the
+    file name, cf. Stock.chart and BackTest.chart. Returns the file names.
+
+    >>> render_many([backtest.chart() for backtest in backtests]) #doctest: +SKIP
+    ['png/GOOG_Bollinger.png', ...]
+    """
+    charts = list(charts)
+    if processes is None:
+        processes = cpu_count()
+    if processes == 1 or len(charts) < 2:
+        return map(_render, charts)
+    pool = Pool(min(processes, len(charts)))
+    try:
+        return pool.map(_render, charts, 1)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,117 @@
+import numpy
+
+from backtest import BackTest, execute_columns
+from cost import Cost, trade_costs
+from indicator import Indicators
+from stock import Stock
+
+
+class Portfolio(Indicators):
+    """ Stocks aligned on a shared date index, back tested in a single pass
+
+    Prices are matrices with one row per date of any of the stocks and one
+    column per stock. A stock without a price on a date keeps its previous
+    price and is nan before its first date.
+
+    >>> portfolio = Portfolio([goog, aapl]) #doctest: +SKIP
+    >>> portfolio(Bollinger(30, 1)) #doctest: +SKIP
+    Portfolio(symbols=[2], dates=[2866], trades=[180], net=1871.2)
+
+    The strategy must implement the vectorized protocol (cf.
+    strategy/__init__.py): its signals method receives the portfolio, whose
+    close, ma, std, upper_bb and lower_bb are matrices, and returns a matrix.
+    Each column is then traded with the BackTest rules and the cost attribute
+    is applied to the trade amounts as BackTest.cost is.
+
+    positions, gross_pnl and net_pnl are dates x stocks matrices, position,
+    gross and net hold the values of each stock at the last date.
+    """
+
+    def __init__(self, stocks):
+        self.symbols = [stock.symbol for stock in stocks]
+        dates = [stock.date for stock in stocks]
+        self.date = numpy.unique(Stock.typed([numpy.concatenate(
+            dates or [[]])])[0])
+        shape = (len(self.date), len(stocks))
+        rows = numpy.searchsorted(self.date, numpy.concatenate(dates or [[]]))
+        columns = numpy.repeat(numpy.arange(len(stocks)),
+                               [len(date) for date in dates])
+        present = numpy.zeros(shape, dtype=bool)
+        present[rows, columns] = True
+        latest = numpy.where(present, numpy.arange(shape[0])[:, None], -1)
+        latest = numpy.maximum.accumulate(latest, axis=0)
+        for field in Stock.fields[1:]:
+            matrix = numpy.empty(shape)
+            matrix.fill(numpy.nan)
+            matrix[rows, columns] = numpy.concatenate(
+                [getattr(stock, field) for stock in stocks] or [[]])
+            matrix = matrix[numpy.maximum(latest, 0),
+                            numpy.arange(shape[1])]
+            matrix[latest < 0] = numpy.nan
+            setattr(self, field, matrix)
+        self.volume[~present] = 0
+        self.cost = Cost()
+        self.strategy = None
+        self.ticks = self.columns = self.sides = numpy.zeros(0, dtype=int)
+
+    def __repr__(self):
+        return 'Portfolio(symbols=[{1}], dates=[{2}], trades=[{3}], \
+net={0})'.format(numpy.nansum(self.net), len(self.symbols), len(self.date),
+                 len(self.ticks))
+
+    def __len__(self):
+        return len(self.date)
+
+    def __call__(self, strategy):
+        self.strategy = strategy
+        self.ticks, self.columns, self.sides = \
+            execute_columns(strategy.signals(self))
+        return self
+
+    def _flows(self, values):
+        """ cumulative sum over time of values at the trades """
+        flows = numpy.zeros(self.close.shape)
+        flows[self.ticks, self.columns] = values
+        return numpy.cumsum(flows, axis=0)
+
+    @property
+    def positions(self):
+        """ numeric position 1/0/-1 of each stock at each date """
+        return self._flows(self.sides).astype('i1')
+
+    @property
+    def gross_pnl(self):
+        """ gross pnl of each stock at each date """
+        return self._flows(-self.sides * self.close[self.ticks, self.columns])
+
+    @property
+    def trade_cost(self):
+        """ accumulated trading costs of each stock at each date """
+        amounts = numpy.abs(self.close[self.ticks, self.columns])
+        volumes = self.volume[self.ticks, self.columns]
+        return self._flows(trade_costs(self.cost, amounts, volumes))
+
+    @property
+    def net_pnl(self):
+        """ net pnl of each stock at each date, closing the position """
+        positions = self.positions
+        value = numpy.where(positions != 0, positions * self.close, 0.0)
+        return value + self.gross_pnl - self.trade_cost
+
+    @property
+    def position(self):
+        """ position of each stock at the last date """
+        if not len(self):
+            return [None] * len(self.symbols)
+        return [BackTest.positions[numeric]
+                for numeric in self.positions[-1].tolist()]
+
+    @property
+    def gross(self):
+        """ gross pnl of each stock for the back test period """
+        return self.gross_pnl[-1] if len(self) else numpy.zeros(0)
+
+    @property
+    def net(self):
+        """ net pnl of each stock for the back test period """
+        return self.net_pnl[-1] if len(self) else numpy.zeros(0)
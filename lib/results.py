@@ -0,0 +1,197 @@
+""" Persistent back test results, addressed by the hash of what they depend on
+
+A result is keyed by the sha1 of the stock data, the strategy class and its
+parameters and the cost model, so running the same back test again, in this
+process or a later one, loads the result instead of computing it. Each result
+is a small compressed numpy file under cache/results/ holding the tick
+indices and orders of the trades and the summary. The least recently used
+results are removed when the results exceed LIMIT bytes.
+
+>>> backtest = results.backtest(goog, Bollinger(30, 1)) #doctest: +SKIP
+
+Strategies and costs which can't be identified, e.g. functions, are not
+cached, cf. key.
+"""
+
+import functools
+import inspect
+import os
+from collections import namedtuple
+from hashlib import sha1
+
+import numpy
+
+import store
+from backtest import BackTest
+from cost import Cost
+
+
+# bump to invalidate the results computed by earlier versions
+VERSION = 2
+LIMIT = 256 * 2 ** 20
+
+Summary = namedtuple('Summary', ['trades', 'position', 'gross', 'net'])
+
+NUMERIC = dict((name, numeric) for numeric, name in BackTest.positions.items())
+
+# bytes of the stored results by directory, counted by evict then updated
+# by save, so save evicts only once they exceed the limit
+_totals = {}
+
+# set in the __flags__ of the classes defined in Python rather than in C
+HEAPTYPE = 1 << 9
+
+
+def path(key=None):
+    directory = os.path.join(store.CACHE, 'results')
+    if key is None:
+        return directory
+    return os.path.join(directory, key + '.npz')
+
+
+def key(stock, strategy, cost):
+    """ Hexadecimal key of the back test of strategy over stock or None
+
+    The parameters of a strategy are the arguments of its __init__, which it
+    must store in attributes of the same names, and its public attributes.
+    None if the cost isn't a Cost or the strategy isn't an instance of a
+    Python class, e.g. a function, a bound method or a functools.partial, or
+    its parameters can't be told from its __init__.
+    """
+    parameters = _parameters(strategy)
+    if parameters is None or not isinstance(cost, Cost):
+        return None
+    cls = strategy.__class__
+    identity = repr((VERSION, stock.digest(), cls.__module__, cls.__name__,
+                     parameters, cost.key))
+    return sha1(identity).hexdigest()
+
+
+def _parameters(strategy):
+    """ sorted (name, value) parameters of strategy, cf. key, or None """
+    cls = type(strategy)
+    if not cls.__flags__ & HEAPTYPE or not hasattr(strategy, '__dict__') or \
+            isinstance(strategy, functools.partial):
+        return None
+    names = []
+    if cls.__init__ is not object.__init__:
+        try:
+            spec = inspect.getargspec(cls.__init__)
+        except TypeError:
+            return None
+        if spec.varargs or spec.keywords:
+            return None
+        names = spec.args[1:]
+    attributes = vars(strategy)
+    if any(name not in attributes for name in names):
+        return None
+    names = set(names).union(name for name in attributes
+                             if not name.startswith('_'))
+    return sorted((name, attributes[name]) for name in names)
+
+
+def load(key):
+    """ (ticks, orders, Summary) stored for key or None """
+    try:
+        with open(path(key), 'rb') as f:
+            stored = numpy.load(f)
+            ticks, orders = stored['ticks'], stored['orders']
+            trades, position, gross, net = stored['summary'].tolist()
+        os.utime(path(key), None)
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    summary = Summary(int(trades), BackTest.positions[int(position)], gross,
+                      net)
+    return ticks, orders, summary
+
+
+def save(key, ticks, orders, summary, limit=None):
+    """ Store the trades and summary of the back test for key
+
+    The least recently used results are evicted once the stored results
+    exceed limit bytes, LIMIT by default.
+    """
+    if not os.path.exists(path()):
+        try:
+            os.makedirs(path())
+        except OSError:
+            pass
+    summary = numpy.array([summary.trades, NUMERIC[summary.position],
+                           summary.gross, summary.net], dtype='f8')
+    store._replace(path(key), lambda f: numpy.savez_compressed(
+        f, ticks=ticks, orders=orders, summary=summary))
+    limit = LIMIT if limit is None else limit
+    if path() in _totals:
+        try:
+            _totals[path()] += os.path.getsize(path(key))
+        except OSError:
+            pass
+    if _totals.get(path(), limit + 1) > limit:
+        evict(limit)
+
+
+def evict(limit=LIMIT):
+    """ Remove the least recently used results beyond limit bytes """
+    try:
+        names = os.listdir(path())
+    except OSError:
+        return
+    files = []
+    for name in names:
+        filename = os.path.join(path(), name)
+        try:
+            status = os.stat(filename)
+        except OSError:
+            continue
+        files.append((status.st_mtime, status.st_size, filename))
+    total = sum(size for mtime, size, filename in files)
+    for mtime, size, filename in sorted(files):
+        if total <= limit:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        total -= size
+    _totals[path()] = total
+
+
+def _summary(backtest):
+    return Summary(len(backtest.trades), backtest.position, backtest.gross,
+                   backtest.net)
+
+
+def _compute(stock, strategy, cost, result_key):
+    backtest = BackTest()
+    backtest.cost = cost
+    backtest(stock, strategy)
+    if result_key is not None:
+        trades = backtest.trades.array
+        save(result_key, trades['tick'], trades['side'], _summary(backtest))
+    return backtest
+
+
+def backtest(stock, strategy, cost=None):
+    """ BackTest of strategy over stock, loaded from the results if stored """
+    cost = Cost() if cost is None else cost
+    result_key = key(stock, strategy, cost)
+    stored = load(result_key) if result_key is not None else None
+    if stored is None:
+        return _compute(stock, strategy, cost, result_key)
+    ticks, orders, summary = stored
+    result = BackTest()
+    result.cost = cost
+    result.stock = stock
+    result.strategy = strategy
+    result.trades.record(stock, ticks, orders)
+    return result
+
+
+def summary(stock, strategy, cost=None):
+    """ Summary of the back test of strategy over stock, stored if new """
+    cost = Cost() if cost is None else cost
+    result_key = key(stock, strategy, cost)
+    stored = load(result_key) if result_key is not None else None
+    if stored is None:
+        return _summary(_compute(stock, strategy, cost, result_key))
+    return stored[2]
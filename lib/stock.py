@@ -1,62 +1,397 @@
 import datetime
 import cPickle as pickle
+import hashlib
+import os
 import re
+import time
+from itertools import izip
+from multiprocessing.pool import ThreadPool
 
-from ext.ystockquote import get_historical_prices
-from matplotlib.pyplot import plot, savefig, clf
+import numpy
 
+from ext.ystockquote import iter_historical_prices, parse_historical_prices, \
+    parse_rows
+
+import plot
+import store
+from indicator import Indicators, append_to, prepend_to
 from tick import Tick
 
 
-class Stock(object):
+class Stock(Indicators):
     """ List like stock data for a given symbol
 
-    Loads from Yahoo when instantiated unless cache is available.
+    Loads from Yahoo unless cache is available, when the data is first
+    accessed.
 
     >>> goog = Stock('GOOG')
     >>> goog
     Stock(symbol=GOOG, data=[1958])
     >>> isinstance(goog[0], Tick)
     True
+
+    The data is stored column wise, one contiguous numpy array per field, and
+    Tick objects are only created when indexing or iterating.
+
+    >>> goog.close #doctest: +SKIP
+    array([ 100.34,  108.31,  109.4 , ...,  591.53])
+
+    Slicing by dates returns a window of the ticks between them, cf.
+    __getitem__.
+
+    >>> goog['2011-01-01':'2012-05-25'] #doctest: +SKIP
+    Stock(symbol=GOOG, data=[352])
     """
 
-    def __init__(self, symbol=None, yahoo=get_historical_prices):
+    fields = ('date', 'open', 'high', 'low', 'close', 'volume', 'adj')
+    # dates given as datetime64 keep their unit, e.g. M8[s] for minute bars
+    dtypes = ('M8[D]', 'f8', 'f8', 'f8', 'f8', 'f8', 'f8')
+    # ticks per chunk of the memory bounded passes over long stocks
+    chunk = 2 ** 20
+    _buffers = None
+    _digest = None
+
+    def __init__(self, symbol=None, yahoo=iter_historical_prices):
         self.yahoo = yahoo
         self.symbol = symbol
-        self.data = []
-        if symbol is not None:
-            self.load(symbol)
+        if symbol is None:
+            self.set_columns([[]] * len(Stock.fields))
+
+    def __getattr__(self, name):
+        """ Columns of a stock instantiated with a symbol, loaded when first
+        accessed """
+        if name not in Stock.fields or 'symbol' not in self.__dict__:
+            raise AttributeError(name)
+        self.load(self.symbol)
+        return self.__dict__[name]
 
     def __repr__(self):
-        return "Stock(symbol={0}, data=[{1}])".format(self.symbol, len(self.data))
+        return "Stock(symbol={0}, data=[{1}])".format(self.symbol, len(self))
+
+    def set_columns(self, columns):
+        """ Set the date, open, high, low, close, volume and adj arrays """
+        for field, column in zip(Stock.fields, Stock.typed(columns)):
+            setattr(self, field, column)
+        self._rolling = None
+        self._values = None
+        self._buffers = None
+        self._parent = None
+        self._digest = None
+
+    def digest(self):
+        """ sha1 of the columns, identifying the data of the stock """
+        if self._digest is None:
+            sha1 = hashlib.sha1()
+            for field in Stock.fields:
+                column = numpy.ascontiguousarray(getattr(self, field))
+                sha1.update(column.dtype.str)
+                sha1.update(column.data)
+            self._digest = sha1.hexdigest()
+        return self._digest
+
+    @staticmethod
+    def typed(columns):
+        """ columns as arrays of Stock.dtypes, copied only if cast """
+        result = []
+        for dtype, column in zip(Stock.dtypes, columns):
+            column = numpy.asarray(column)
+            if column.dtype.kind != 'M' or numpy.dtype(dtype).kind != 'M':
+                column = numpy.asarray(column, dtype=dtype)
+            result.append(column)
+        return result
+
+    def window(self, start, stop, shared=True):
+        """ Stock of the ticks from start to stop, sharing arrays and indicators
+
+        The columns are views of the columns of the stock and the indicators
+        are slices of its indicators, computed once over the whole stock, so
+        the windows of a ma(30) start with the ma of the 29 days before them.
+        Unless shared, the window computes its own indicators, over its ticks
+        only.
+
+        >>> goog.window(1000, 1250) #doctest: +SKIP
+        Stock(symbol=GOOG, data=[250])
+        """
+        start, stop, step = slice(start, stop).indices(len(self))
+        result = Stock(None, self.yahoo)
+        result.symbol = self.symbol
+        result.set_columns([getattr(self, field)[start:stop]
+                            for field in Stock.fields])
+        if not shared:
+            return result
+        result._parent = (self, start)
+        return result
+
+    def append(self, bar):
+        """ Append bar, a (date, open, high, low, close, volume, adj) tuple
+
+        The columns grow in O(1) amortized and the rolling indicators, once
+        computed, are extended rather than recomputed, so a Stock can be fed
+        one bar at a time, cf. BackTest.stream.
+
+        >>> stock = Stock()
+        >>> stock.append((datetime.date(2012, 5, 25), 1.0, 1.0, 1.0, 2.0, 1, 2.0))
+        >>> stock.close.tolist()
+        [2.0]
+        """
+        size = len(self)
+        if self._parent is not None:
+            # a window appended to becomes a stock of its own
+            self._rolling = self._values = self._parent = None
+        if self._buffers is None:
+            self._buffers = [getattr(self, field) for field in Stock.fields]
+        for index, (field, value) in enumerate(zip(Stock.fields, bar)):
+            self._buffers[index] = append_to(self._buffers[index], size, value)
+            setattr(self, field, self._buffers[index][:size + 1])
+        if self._rolling is not None:
+            self._rolling.append(self.close.item(size))
+        self._values = self._digest = None
+
+    def bars(self):
+        """ Iterator of the (date, open, high, low, close, volume, adj) bars
+
+        Replays the stock, e.g. into another Stock through append.
+        """
+        return izip(*[getattr(self, field).tolist() for field in Stock.fields])
 
     def load(self, symbol):
-        """ Loads the stock quote for symbol from Yahoo or cache """
-        raw = Stock.get_from_cache(symbol)
-        if raw is None:
-            today = datetime.date.today().strftime('%Y%m%d')
-            raw = self.yahoo(symbol, '20010103', today)
-            Stock.save_to_cache(symbol, raw)
-        # Tick aware of the time series it belongs to
-        self.data.extend(
-            [ Tick(self.data, index, *Stock.cast(tick))
-              for index, tick
-              in enumerate(reversed(raw[1:])) ])
+        """ Loads the stock quote for symbol from cache and Yahoo
+
+        Only the days missing from the cache are fetched from Yahoo.
+        """
+        self.set_columns(self.update_cache(symbol))
+
+    @classmethod
+    def load_many(cls, symbols, yahoo=iter_historical_prices, threads=8,
+                  retries=3, delay=1.0):
+        """ List of Stock for symbols, fetching the missing ones concurrently
+
+        Symbols cached today are loaded from disk, the others are loaded by a
+        pool of at most threads threads. A failing load is retried up to
+        retries times, waiting delay seconds doubled at each attempt. A symbol
+        listed twice is loaded once, into the same Stock.
+
+        >>> Stock.load_many(['GOOG', 'AAPL']) #doctest: +SKIP
+        [Stock(symbol=GOOG, data=[1958]), Stock(symbol=AAPL, data=[2866])]
+        """
+        by_symbol = dict((symbol, cls(None, yahoo)) for symbol in symbols)
+        missing = []
+        for symbol, stock in by_symbol.items():
+            stock.symbol = symbol
+            columns = Stock.get_from_cache(symbol)
+            if columns is None:
+                missing.append(stock)
+            else:
+                stock.set_columns(columns)
+
+        def load(stock):
+            for attempt in xrange(retries + 1):
+                try:
+                    return stock.load(stock.symbol)
+                except Exception:
+                    if attempt == retries:
+                        raise
+                    time.sleep(delay * 2 ** attempt)
+
+        if missing:
+            pool = ThreadPool(min(threads, len(missing)))
+            try:
+                pool.map(load, missing)
+            finally:
+                pool.close()
+                pool.join()
+        return [by_symbol[symbol] for symbol in symbols]
+
+    def update_cache(self, symbol):
+        """ Fetch the days after the last cached one and return the columns
+
+        Symbols imported from a file (cf. read) are never fetched.
+        """
+        if not store.exists(symbol):
+            Stock.migrate_cache(symbol)
+        cached = store.load(symbol, Stock.fields)
+        today = datetime.date.today()
+        if cached is None or not len(cached[0][0]):
+            columns = Stock.parse(self.yahoo(symbol, '20010103',
+                                             today.strftime('%Y%m%d')))
+            Stock.save_to_cache(symbol, columns)
+            return columns
+        columns, updated = cached
+        if updated >= today or store.source(symbol) is not None:
+            return columns
+        last = columns[0][-1]
+        # the day after the last one, whatever the unit of the dates
+        start = (last.astype('M8[D]') + 1).item()
+        fetched = [column[:0] for column in columns]
+        if start <= today:
+            fetched = Stock.parse(self.yahoo(symbol, start.strftime('%Y%m%d'),
+                                             today.strftime('%Y%m%d')))
+            new = fetched[0] > last
+            fetched = [column[new] for column in fetched]
+        store.append(symbol, Stock.fields, fetched, today)
+        return store.load(symbol, Stock.fields)[0]
+
+    @staticmethod
+    def parse(raw):
+        """ Columns of Yahoo data, most recent last
+
+        raw is either an iterator of typed (dates, values) chunks, cf.
+        ext.ystockquote.parse_historical_prices, or a nested list of strings
+        with a header row. Yahoo lists the most recent day first, each chunk
+        is copied reversed before the older days into columns filled from
+        their end, and grown as the chunks arrive (cf. prepend_to).
+        """
+        if isinstance(raw, list):
+            rows = [row for row in raw[1:] if len(row) == len(Stock.fields)]
+            raw = [parse_rows(rows)] if rows else []
+        columns = [numpy.empty(0, dtype=dtype) for dtype in Stock.dtypes]
+        size = 0
+        for chunk in raw:
+            if not size:
+                columns[0] = numpy.empty(0, dtype=chunk[0].dtype)
+            columns = [prepend_to(column, size, values[::-1])
+                       for column, values
+                       in zip(columns, Stock._chunk_columns(*chunk))]
+            size += len(chunk[0])
+        return [column[len(column) - size:] for column in columns]
+
+    @staticmethod
+    def _chunk_columns(dates, values):
+        """ columns of a (dates, values) chunk, adj is the close if missing """
+        adj = values[:, 5] if values.shape[1] > 5 else values[:, 3]
+        return [dates] + [values[:, index] for index in xrange(5)] + [adj]
+
+    @classmethod
+    def read(cls, filename, symbol=None, chunk_size=2 ** 24):
+        """ Stock of the bars of a local CSV file, oldest first
+
+        After a header line, each line holds a timestamp, e.g. 2012-05-25 or
+        2012-05-25 09:30:00, then open, high, low, close, volume and
+        optionally adj. The file is imported chunk_size bytes at a time into
+        the binary store under symbol (the file name by default) which is then
+        memory mapped, so memory stays bounded whatever the size of the file.
+        The file is imported again only once modified, the store is used
+        while the file is missing.
+
+        >>> Stock.read('data/EURUSD_minutes.csv') #doctest: +SKIP
+        Stock(symbol=EURUSD_minutes, data=[112233445])
+        """
+        if symbol is None:
+            symbol = os.path.splitext(os.path.basename(filename))[0]
+        meta = store.path(symbol, 'meta')
+        if not os.path.exists(meta) or os.path.exists(filename) and \
+                os.path.getmtime(meta) < os.path.getmtime(filename):
+            store.remove(symbol)
+            today = datetime.date.today()
+            unit = None
+            with open(filename) as f:
+                for dates, values in parse_historical_prices(f, chunk_size):
+                    unit = unit or dates.dtype
+                    columns = Stock.typed(Stock._chunk_columns(
+                        dates.astype(unit), values))
+                    if store.exists(symbol):
+                        store.append(symbol, Stock.fields, columns, today)
+                    else:
+                        store.save(symbol, Stock.fields, columns, today,
+                                   os.path.abspath(filename))
+            if not store.exists(symbol):
+                store.save(symbol, Stock.fields,
+                           Stock.typed([[]] * len(Stock.fields)), today,
+                           os.path.abspath(filename))
+        result = cls(None)
+        result.symbol = symbol
+        result.set_columns(store.load(symbol, Stock.fields)[0])
+        return result
+
+    def resample(self, frequency):
+        """ Stock of the bars aggregated over periods of frequency
+
+        frequency is a number, 1 by default, followed by a datetime64 unit:
+        Y, M (month), W, D, h, m (minute), s, ms, us or ns. The date of a bar
+        is the start of its period, its open and close those of the first and
+        last bars of the period, its high and low the extremes and its volume
+        the total.
+
+        >>> minutes.resample('5m') #doctest: +SKIP
+        Stock(symbol=EURUSD_minutes, data=[22446689])
+        >>> goog.resample('W').close #doctest: +SKIP
+
+        The periods are found chunk by chunk and the columns reduced in place
+        so memory stays bounded by the number of bars of the result.
+        """
+        match = re.match(r'(\d*)([A-Za-z]+)$', frequency)
+        if match is None:
+            raise ValueError('invalid frequency {0!r}'.format(frequency))
+        count = int(match.group(1) or 1)
+        unit = 'M8[{0}]'.format(match.group(2))
+        starts = []
+        last = None
+        for begin in xrange(0, len(self), Stock.chunk):
+            periods = self.date[begin:begin + Stock.chunk].astype(unit) \
+                .astype('i8') // count
+            if periods[0] != last:
+                starts.append([begin])
+            starts.append(numpy.flatnonzero(numpy.diff(periods)) + begin + 1)
+            last = periods[-1]
+        starts = numpy.concatenate(starts or [[]]).astype(int)
+        ends = numpy.append(starts[1:], len(self)) - 1
+        periods = self.date[starts].astype(unit).astype('i8') // count
+        result = Stock(None, self.yahoo)
+        result.symbol = self.symbol
+        if not len(starts):
+            result.set_columns([self.date.astype(unit)] +
+                               [[]] * (len(Stock.fields) - 1))
+            return result
+        result.set_columns([(periods * count).astype(unit), self.open[starts],
+                            numpy.maximum.reduceat(self.high, starts),
+                            numpy.minimum.reduceat(self.low, starts),
+                            self.close[ends],
+                            numpy.add.reduceat(self.volume, starts),
+                            self.adj[ends]])
+        return result
 
     @staticmethod
     def get_from_cache(symbol):
-        """ Get the date for symbol from cache return list or none """
-        try:
-            with open('cache/{0}_{1}'.format(symbol, datetime.date.today())) as f:
-                return pickle.load(f)
-        except (IOError, EOFError):
+        """ Get today's memory mapped columns for symbol from cache or None """
+        if not store.exists(symbol):
+            Stock.migrate_cache(symbol)
+        cached = store.load(symbol, Stock.fields)
+        if cached is None or cached[1] != datetime.date.today():
             return None
+        return cached[0]
 
     @staticmethod
-    def save_to_cache(symbol, raw):
-        """ Save the data coming from Yahoo into cache """
-        with open('cache/{0}_{1}'.format(symbol, datetime.date.today()), 'w') as f:
-            pickle.dump(raw, f)
+    def save_to_cache(symbol, columns):
+        """ Save the columns coming from Yahoo into cache """
+        store.save(symbol, Stock.fields, Stock.typed(columns),
+                   datetime.date.today())
+
+    @staticmethod
+    def migrate_cache(symbol=None):
+        """ Move the cache/SYMBOL_DATE pickles into the binary store
+
+        Only the most recent pickle of a symbol is kept, for every symbol
+        unless symbol is given.
+        """
+        legacy = re.compile(r'(?P<symbol>.+)_(?P<date>\d{4}-\d{2}-\d{2})$')
+        pickles = {}
+        for name in sorted(os.listdir(store.CACHE)):
+            match = legacy.match(name)
+            if match and symbol in (None, match.group('symbol')):
+                pickles.setdefault(match.group('symbol'), []).append(match)
+        for legacy_symbol, matches in pickles.items():
+            latest = matches[-1]
+            updated = datetime.date(*map(int, latest.group('date').split('-')))
+            cached = store.load(legacy_symbol, Stock.fields)
+            try:
+                if cached is None or cached[1] < updated:
+                    with open(os.path.join(store.CACHE, latest.group())) as f:
+                        columns = Stock.parse(pickle.load(f))
+                    store.save(legacy_symbol, Stock.fields, columns, updated)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                continue
+            for match in matches:
+                os.remove(os.path.join(store.CACHE, match.group()))
 
     @staticmethod
     def cast(raw_tick):
@@ -64,20 +399,74 @@ class Stock(object):
 
         >>> Stock.cast(('2012-05-25', '1.0'))
         [datetime.date(2012, 5, 25), 1.0]
+        >>> Stock.cast(('2012-05-25 09:30:00', '1.0'))
+        [datetime.datetime(2012, 5, 25, 9, 30), 1.0]
         """
-        result = [ datetime.date(*map(int, raw_tick[0].split('-'))) ]
+        if len(raw_tick[0]) > 10:
+            result = [numpy.datetime64(raw_tick[0], 'us').item()]
+        else:
+            result = [ datetime.date(*map(int, raw_tick[0].split('-'))) ]
         result.extend( map(float, raw_tick[1:]) )
         return result
 
     def __iter__(self):
-        for tick in self.data:
-            yield tick
+        for index in xrange(len(self)):
+            yield self[index]
 
     def __getitem__(self, index):
-        return self.data[index]
+        """ Tick aware of the time series it belongs to
+
+        Slices of dates, as strings, datetime.date or numpy.datetime64,
+        return a Stock of the ticks from the start date to the end of the
+        stop date, e.g. goog['2012-01':'2012-03'] holds the first quarter,
+        and a date alone selects its period, e.g. goog['2012-05']. The dates
+        are found by binary search and the columns are views of the columns
+        of the stock, so only the pages of the cache holding the slice are
+        read. Its indicators are computed over its ticks only (cf. window).
+        """
+        if isinstance(index, slice):
+            if Stock.is_date(index.start) or Stock.is_date(index.stop):
+                return self.window(*self.dates(index.start, index.stop),
+                                   shared=False)
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if Stock.is_date(index):
+            return self.window(*self.dates(index, index), shared=False)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Stock index out of range')
+        date = self.date.item(index)
+        if isinstance(date, (int, long)):
+            # datetime64 finer than microseconds are not converted by item
+            date = self.date[index].astype('M8[us]').item()
+        return Tick(self, index, date, self.open.item(index),
+                    self.high.item(index), self.low.item(index),
+                    self.close.item(index), self.volume.item(index),
+                    self.adj.item(index))
 
     def __len__(self):
-        return len(self.data)
+        return len(self.date)
+
+    @staticmethod
+    def is_date(value):
+        return isinstance(value, (basestring, datetime.date,
+                                  numpy.datetime64))
+
+    def dates(self, start=None, stop=None):
+        """ (start, stop) tick indices of the ticks from start to end of stop
+
+        >>> goog.dates('2012-05', '2012-05-24') #doctest: +SKIP
+        (1940, 1956)
+        """
+        dtype = self.date.dtype
+        begin, end = 0, len(self)
+        if start is not None:
+            start = numpy.datetime64(start).astype(dtype)
+            begin = self.date.searchsorted(start)
+        if stop is not None:
+            stop = numpy.datetime64(stop)
+            end = self.date.searchsorted((stop + 1).astype(dtype))
+        return int(begin), int(max(begin, end))
 
     def plot(self, *args):
         """ Save a plot of Tick args under the name symbol.png
@@ -87,18 +476,14 @@ class Stock(object):
 
         >>> Stock('GOOG').plot('close', 'upper_bb(30, 1)', 'lower_bb(30, 1)') #doctest: +SKIP
         """
-        for value in args:
-            match = re.match(r"(?P<method>\w+)(?P<parameters>\(.*\))?", value)
-            dict_ = match.groupdict()
-            method = dict_['method']
-            parameters = None
-            if dict_['parameters']:
-                parameters = map(int, dict_['parameters'][1:-1].split(','))
-            if parameters:
-                plot([t.date for t in self],
-                     [getattr(t, method)(*parameters) for t in self])
-            else:
-                plot([t.date for t in self],
-                     [getattr(t, method) for t in self])
-        savefig('png/{0}.png'.format(self.symbol))
-        clf()
+        plot.lines(*self.chart(*args)[1])
+
+    def chart(self, *args):
+        """ (function, arguments) rendering the plot, cf. lib.plot.render_many
+
+        args are columns or indicator expressions (cf. Indicators.evaluate),
+        computed here for the whole stock, the rendering only draws the arrays.
+        """
+        series = [(value, self.evaluate(value)) for value in args]
+        return plot.lines, ('png/{0}.png'.format(self.symbol), self.date,
+                            series)
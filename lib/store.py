@@ -0,0 +1,113 @@
+""" Binary price store, one directory per symbol under cache/
+
+Each column is a raw binary file memory mapped when loaded, so loading a
+symbol copies nothing and processes reading the same symbol share pages. The
+meta file records the dtype of the columns, their length, the date the
+symbol was last updated from Yahoo and, for a symbol imported from a local
+file rather than Yahoo, its source.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+import numpy
+
+
+CACHE = 'cache'
+
+
+def path(symbol, name=''):
+    return os.path.join(CACHE, symbol, name)
+
+
+def exists(symbol):
+    return os.path.exists(path(symbol, 'meta'))
+
+
+def load(symbol, fields):
+    """ Memory mapped fields of symbol and date of last update or None """
+    try:
+        with open(path(symbol, 'meta')) as f:
+            meta = json.load(f)
+    except (IOError, ValueError):
+        return None
+    size = meta['size']
+    columns = []
+    for field in fields:
+        dtype = numpy.dtype(str(meta['dtypes'][field]))
+        if size:
+            column = numpy.memmap(path(symbol, field), dtype=dtype, mode='r',
+                                  shape=(size,))
+        else:
+            column = numpy.empty(0, dtype=dtype)
+        columns.append(column)
+    updated = datetime.datetime.strptime(meta['updated'], '%Y-%m-%d')
+    return columns, datetime.date(updated.year, updated.month, updated.day)
+
+
+def source(symbol):
+    """ File the columns of symbol were imported from, None for Yahoo """
+    try:
+        with open(path(symbol, 'meta')) as f:
+            return json.load(f).get('source')
+    except (IOError, ValueError):
+        return None
+
+
+def save(symbol, fields, columns, updated, source=None):
+    """ Write the columns of symbol, replacing any previous data """
+    if not os.path.exists(path(symbol)):
+        os.makedirs(path(symbol))
+    for field, column in zip(fields, columns):
+        _replace(path(symbol, field),
+                 lambda f: numpy.ascontiguousarray(column).tofile(f))
+    _write_meta(symbol, fields, columns, len(columns[0]), updated, source)
+
+
+def append(symbol, fields, columns, updated):
+    """ Append the columns at the end of the stored columns of symbol
+
+    Only the new rows are written. The meta file is replaced last so readers
+    never map more rows than were written.
+    """
+    with open(path(symbol, 'meta')) as f:
+        meta = json.load(f)
+    size = meta['size']
+    for field, column in zip(fields, columns):
+        with open(path(symbol, field), 'r+b' if size else 'wb') as f:
+            f.seek(size * column.dtype.itemsize)
+            f.truncate()
+            numpy.ascontiguousarray(column).tofile(f)
+    _write_meta(symbol, fields, columns, size + len(columns[0]), updated,
+                meta.get('source'))
+
+
+def remove(symbol):
+    shutil.rmtree(path(symbol), ignore_errors=True)
+
+
+def _write_meta(symbol, fields, columns, size, updated, source=None):
+    meta = {'size': size,
+            'updated': updated.strftime('%Y-%m-%d'),
+            'dtypes': dict((field, column.dtype.str)
+                           for field, column in zip(fields, columns))}
+    if source is not None:
+        meta['source'] = source
+    _replace(path(symbol, 'meta'), lambda f: json.dump(meta, f))
+
+
+def _replace(filename, write):
+    """ Atomically replace filename, readers keep the mapping they hold
+
+    The temporary file is unique, so concurrent writers never write to the
+    same file, the last renamed wins.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=os.path.basename(filename) + '.',
+        dir=os.path.dirname(filename))
+    with os.fdopen(descriptor, 'wb') as f:
+        write(f)
+    os.rename(temporary, filename)
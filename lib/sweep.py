@@ -0,0 +1,157 @@
+import inspect
+from collections import namedtuple
+from itertools import product
+from multiprocessing import Pool, cpu_count
+
+import results
+from backtest import BackTest, pnl_columns
+from cost import Cost
+
+
+Result = namedtuple('Result', ['symbol', 'parameters', 'trades', 'position',
+                               'gross', 'net'])
+
+# function and context of pool_map, inherited by the worker processes
+_context = None
+# signals per task of strategies with grid_signals
+CELLS = 2 ** 22
+
+
+def _initialize(context):
+    global _context
+    _context = context
+
+
+def _call(task):
+    function, context = _context
+    return function(context, task)
+
+
+def pool_map(function, tasks, context, processes=None):
+    """ List of function(context, task) for each task over processes workers
+
+    The context, e.g. stocks, is handed to each worker once when it starts,
+    under fork its arrays are shared rather than pickled, and tasks should
+    only carry indices and parameters. function must be a module level
+    function. The tasks are run inline if processes is 1.
+    """
+    if processes is None:
+        processes = cpu_count()
+    if processes == 1:
+        _initialize((function, context))
+        try:
+            return map(_call, tasks)
+        finally:
+            _initialize(None)
+    pool = Pool(processes, _initialize, ((function, context),))
+    try:
+        chunksize = max(1, len(tasks) // (4 * processes))
+        return pool.map(_call, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _run(context, task):
+    """ back test one parameters combination on one stock """
+    stocks, strategy, cost, cache = context
+    index, parameters = task
+    if cache:
+        return Result(stocks[index].symbol, parameters,
+                      *results.summary(stocks[index], strategy(**parameters),
+                                       cost))
+    backtest = BackTest()
+    if cost is not None:
+        backtest.cost = cost
+    backtest(stocks[index], strategy(**parameters))
+    return Result(stocks[index].symbol, parameters, len(backtest.trades),
+                  backtest.position, backtest.gross, backtest.net)
+
+
+def _run_grid(context, task):
+    """ back test combinations at once on one stock, cf. grid_signals """
+    stocks, strategy, cost, parameters = context
+    index, selected = task
+    stock = stocks[index]
+    selected = [parameters[combination] for combination in selected]
+    signals = strategy.grid_signals(stock, selected)
+    summaries = pnl_columns(stock.close, signals, cost, stock.volume)
+    return [Result(stock.symbol, kwargs, trades, BackTest.positions[position],
+                   gross, net)
+            for kwargs, trades, position, gross, net
+            in zip(selected, *[summary.tolist() for summary in summaries])]
+
+
+def _grid(strategy, parameters, stocks, cost, processes):
+    """ sweep of a strategy defining grid_signals, by batches of combinations
+
+    Batches follow the order of the arguments of the strategy constructor,
+    so that combinations sharing the leading arguments, e.g. the period of
+    Bollinger(n, k), are computed together.
+    """
+    try:
+        names = inspect.getargspec(strategy.__init__).args[1:]
+    except TypeError:
+        names = []
+    order = sorted(xrange(len(parameters)),
+                   key=lambda combination: [parameters[combination].get(name)
+                                            for name in names])
+    workers = processes or cpu_count()
+    tasks = []
+    for index, stock in enumerate(stocks):
+        batch = max(1, min(CELLS // max(len(stock), 1),
+                           -(-len(parameters) * len(stocks) // workers)))
+        tasks.extend((index, order[start:start + batch])
+                     for start in xrange(0, len(order), batch))
+    context = (stocks, strategy, Cost() if cost is None else cost, parameters)
+    results = [None] * (len(stocks) * len(parameters))
+    for (index, selected), batch in zip(
+            tasks, pool_map(_run_grid, tasks, context, processes)):
+        for combination, result in zip(selected, batch):
+            results[index * len(parameters) + combination] = result
+    return results
+
+
+def combinations(grid):
+    """ List of keyword arguments for every combination of the grid values
+
+    >>> combinations({'n': [20, 30], 'k': [1]})
+    [{'k': 1, 'n': 20}, {'k': 1, 'n': 30}]
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in product(*[grid[name] for name in names])]
+
+
+def sweep(strategy, grid, stocks, cost=None, processes=None, cache=False):
+    """ Back test strategy for every combination of grid over every stock
+
+    strategy is a strategy class, grid maps its keyword arguments to the list
+    of values to try. Returns a list of Result ordered by stock then by
+    parameters combination.
+
+    >>> sweep(Bollinger, {'n': range(5, 201), 'k': [0.5, 1, 2, 3]},
+    ...       [goog, aapl]) #doctest: +SKIP
+    [Result(symbol='GOOG', parameters={'k': 0.5, 'n': 5}, trades=...), ...]
+
+    The work is spread over processes workers (cpu count by default) by
+    pool_map, tasks only carry a stock index and the parameters. Tasks for a
+    stock are contiguous so that its memoized indicators are reused across
+    the combinations of a worker.
+
+    With cache the results are stored (cf. lib/results.py) and only the
+    combinations never back tested over the same data and cost are run.
+
+    Without cache, strategies defining grid_signals (cf.
+    strategy/__init__.py) get the signals of batches of combinations at once
+    and each batch is executed as a matrix (cf. backtest.pnl_columns). A
+    batch holds at most CELLS signals.
+    """
+    for stock in stocks:
+        len(stock)  # lazy stocks are loaded once, before the workers start
+    parameters = combinations(grid)
+    if not cache and hasattr(strategy, 'grid_signals'):
+        return _grid(strategy, parameters, stocks, cost, processes)
+    tasks = [(index, kwargs) for index in xrange(len(stocks))
+             for kwargs in parameters]
+    return pool_map(_run, tasks, (stocks, strategy, cost, cache), processes)
@@ -11,8 +11,10 @@ class Tick(namedtuple('Tick',
                        'close', 'volume', 'adj'])):
     """ Tick i.e. stock price etc. on a given day
 
-    Contains a reference to the time series it belongs to (Stock.data) and its
-    index in the list in order to compute metrics.
+    Contains a reference to the time series it belongs to (Stock) and its
+    index in the list in order to compute metrics. Metrics of a Tick from a
+    Stock are looked up in O(1) from the Stock rolling indicators, a plain list
+    of Tick is sliced.
 
     >>> Tick([], 0, datetime.date(2012, 5, 25), 1.0, 1.0, 1.0,
     ...              1.0, 1, 1.0)
@@ -27,10 +29,16 @@ open={0.open}, high={0.high}, low={0.low}, close={0.close}, \
 volume={0.volume}, adj={0.adj})'.format(self)
 
     def std(self, n):
+        rolling = getattr(self.series, 'rolling', None)
+        if rolling is not None:
+            return rolling.std_at(self.index, n)
         index = self.index + 1
         return numpy.std([tick.close for tick in self.series[index-n:index]])
 
     def ma(self, n):
+        rolling = getattr(self.series, 'rolling', None)
+        if rolling is not None:
+            return rolling.ma_at(self.index, n)
         index = self.index + 1
         return numpy.mean([tick.close for tick in self.series[index-n:index]])
 
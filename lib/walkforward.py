@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from backtest import BackTest
+from sweep import combinations, pool_map
+
+
+Result = namedtuple('Result', ['train', 'test', 'parameters', 'train_net',
+                               'trades', 'position', 'gross', 'net'])
+
+
+def windows(size, train, test, step=None, anchored=False):
+    """ List of ((start, stop), (start, stop)) train and test windows
+
+    Test windows of test ticks follow train windows of train ticks, moving
+    forward by step ticks (test by default). Anchored train windows all start
+    at the first tick.
+
+    >>> windows(10, 4, 2)
+    [((0, 4), (4, 6)), ((2, 6), (6, 8)), ((4, 8), (8, 10))]
+    >>> windows(10, 4, 3, anchored=True)
+    [((0, 4), (4, 7)), ((0, 7), (7, 10))]
+    """
+    step = step or test
+    return [((0 if anchored else start, start + train),
+             (start + train, start + train + test))
+            for start in xrange(0, size - train - test + 1, step)]
+
+
+def _backtest(stock, strategy, cost):
+    backtest = BackTest()
+    if cost is not None:
+        backtest.cost = cost
+    return backtest(stock, strategy)
+
+
+def _run(context, task):
+    """ choose the parameters on the train window, back test the test one """
+    stock, strategy, grid, cost = context
+    train, test = task
+    train_stock = stock.window(*train)
+    best = None
+    for parameters in combinations(grid):
+        net = _backtest(train_stock, strategy(**parameters), cost).net
+        if best is None or net > best[0]:
+            best = (net, parameters)
+    backtest = _backtest(stock.window(*test), strategy(**best[1]), cost)
+    return Result(train, test, best[1], best[0], len(backtest.trades),
+                  backtest.position, backtest.gross, backtest.net)
+
+
+def walk_forward(strategy, grid, stock, train, test, step=None,
+                 anchored=False, cost=None, processes=None):
+    """ Walk forward evaluation of strategy over stock
+
+    For each window (cf. windows) the combination of grid with the best net
+    pnl over the train ticks is back tested over the following test ticks.
+    Returns a Result per window with the ticks of the windows, the chosen
+    parameters, their train net pnl and the trades, position, gross and net
+    pnl of the test window.
+
+    >>> walk_forward(Bollinger, {'n': [10, 20, 30], 'k': [1, 2]}, goog,
+    ...              500, 100) #doctest: +SKIP
+    [Result(train=(0, 500), test=(500, 600), parameters={'k': 2, 'n': 10}, ...]
+
+    Windows are views of stock (cf. Stock.window) sharing its indicators.
+    The indicators of vectorized strategies are computed once over the whole
+    stock before the windows are spread over processes workers (cf.
+    lib.sweep.pool_map), which inherit them under fork.
+    """
+    for parameters in combinations(grid):
+        instance = strategy(**parameters)
+        if hasattr(instance, 'signals'):
+            instance.signals(stock)
+    tasks = windows(len(stock), train, test, step, anchored)
+    return pool_map(_run, tasks, (stock, strategy, grid, cost), processes)
@@ -10,11 +10,39 @@ the band K : Bollinger(N, K)
 
 >>> bollinger = Bollinger(30, 1)
 
+Store each argument of __init__ in an attribute of the same name, like
+Bollinger's n and k: lib.results identifies a strategy by them to store its
+back tests, a strategy keeping them otherwise isn't stored.
+
 Define your strategy in the magic method __call__(self, tick) in order to be
 able to call the strategy with a Tick.
 
 >>> bollinger(tick) #doctest: +SKIP
 'sell'
+
+Optionally define signals(self, stock) returning a numpy array holding 1 (buy),
+-1 (sell) or 0 (None) for every tick of the Stock. BackTest then runs the
+strategy once over the whole stock instead of calling it for each tick, the
+result must be the same.
+
+>>> bollinger.signals(goog) #doctest: +SKIP
+array([ 0,  0,  0, ..., -1, -1, -1], dtype=int8)
+
+Optionally define warmup, the number of ticks before a tick its signal depends
+on. BackTest then computes the signals of long stocks by chunks, keeping the
+memory bounded.
+
+Optionally define the class method grid_signals(cls, stock, parameters)
+returning a ticks x parameters matrix whose columns are the signals of
+cls(**kwargs) for each kwargs of the parameters list. lib.sweep then computes
+the signals of many combinations at once and executes them as a matrix.
+
+>>> Bollinger.grid_signals(goog, [{'n': 30, 'k': 1}, {'n': 30, 'k': 2}]) #doctest: +SKIP
+array([[ 0,  0], ..., [-1,  0]], dtype=int8)
+
+The indicator arrays of the stock are memoized, signals should get them from
+stock.indicator(name, *parameters) (cf. lib/indicator.py) to share them with
+the other strategies and plots over the same stock.
 """
 
 from bollinger import Bollinger
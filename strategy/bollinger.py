@@ -1,3 +1,6 @@
+import numpy
+
+
 class Bollinger(object):
     """ Bollinger's band trading strategy
 
@@ -13,10 +16,45 @@ class Bollinger(object):
         self.n = n
         self.k = k
 
+    @property
+    def warmup(self):
+        """ number of ticks before a tick its signal depends on """
+        return self.n - 1
+
     def __call__(self, tick):
         if tick.close > tick.upper_bb(self.n, self.k):
             return 'buy'
         elif tick.close < tick.lower_bb(self.n, self.k):
             return 'sell'
 
+    def signals(self, stock):
+        """ buy (1), sell (-1) or None (0) for every tick of stock """
+        close = stock.close
+        buy = close > stock.indicator('upper_bb', self.n, self.k)
+        sell = close < stock.indicator('lower_bb', self.n, self.k)
+        return numpy.where(buy, 1, numpy.where(sell, -1, 0)).astype('i1')
+
+    @classmethod
+    def grid_signals(cls, stock, parameters):
+        """ signals of Bollinger(**kwargs) for each kwargs of parameters
 
+        Returns a ticks x parameters matrix. The ma and std of all the
+        periods are computed together (cf. lib.indicator.Rolling.windows) and
+        the bands of all the widths of a period by broadcasting. The windows
+        are reduced exactly, so the cost grows with the sum of the periods.
+        """
+        ns = sorted(set(kwargs['n'] for kwargs in parameters))
+        ma, std = stock.rolling.windows(ns)
+        close = stock.close[:, None]
+        result = numpy.empty((len(stock), len(parameters)), dtype='i1',
+                             order='F')
+        for index, n in enumerate(ns):
+            columns = [column for column, kwargs in enumerate(parameters)
+                       if kwargs['n'] == n]
+            ks = numpy.array([parameters[column]['k'] for column in columns])
+            width = ks * std[:, index:index + 1]
+            buy = close > ma[:, index:index + 1] + width
+            sell = close < ma[:, index:index + 1] - width
+            sell &= ~buy
+            result[:, columns] = buy.view('i1') - sell.view('i1')
+        return result
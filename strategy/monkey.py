@@ -1,17 +1,48 @@
 import random
 
+import numpy
+
+
 class Monkey(object):
     """ Silly monkey strategy every freq tick roll the dice
 
     To instantiate a 30 tick monkey:
 
     >>> monkey = Monkey(30)
+
+    The dice rolls are drawn from a numpy RandomState seeded with seed, or
+    with a seed drawn from the random module if not given, so a monkey with a
+    given seed always makes the same trades.
+
+    >>> Monkey(2, seed=0).signals(range(7)).tolist()
+    [-1, 0, 0, 0, -1, 0, 0]
     """
 
-    def __init__(self, freq):
+    orders = {1: 'buy', -1: 'sell', 0: None}
+
+    def __init__(self, freq, seed=None):
         self.freq = freq
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self._rolls = numpy.zeros(0, dtype='i1')
+
+    def rolls(self, count):
+        """ first count dice rolls, 1 (buy), -1 (sell) or 0 (None) """
+        if len(self._rolls) < count:
+            size = max(count, 2 * len(self._rolls))
+            self._rolls = numpy.random.RandomState(self.seed) \
+                .randint(-1, 2, size).astype('i1')
+        return self._rolls[:count]
 
     def __call__(self, tick):
         if tick.index % self.freq:
             return None
-        return random.choice(('buy', 'sell', None))
+        roll = tick.index // self.freq
+        return Monkey.orders[self.rolls(roll + 1)[roll]]
+
+    def signals(self, stock):
+        """ buy (1), sell (-1) or None (0) for every tick of stock """
+        result = numpy.zeros(len(stock), dtype='i1')
+        result[::self.freq] = self.rolls(len(result[::self.freq]))
+        return result
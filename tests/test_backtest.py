@@ -1,13 +1,17 @@
 import unittest
-import os
 import datetime
+import os
+import tempfile
 
+import numpy
 from numpy.testing.utils import assert_almost_equal
 
 from lib.stock import Stock
 from lib.tick import Tick
-from lib.backtest import Trade, BackTest
-from test_helpers import get_historical_prices, raise_if_called, NewDate
+from lib.backtest import Trade, BackTest, Ledger, execute
+from strategy import Bollinger
+from test_helpers import get_historical_prices, raise_if_called, NewDate, \
+    clear_cache
 
 class TestBackTest(unittest.TestCase):
 
@@ -20,7 +24,7 @@ class TestBackTest(unittest.TestCase):
 
     def tearDown(self):
         datetime.date = self.built_in_date
-        os.remove('cache/GOOG_2012-05-25')
+        clear_cache('GOOG')
         self.backtest.stock = None
         self.backtest.trades = []
         self.backtest.cost = lambda trade: 0
@@ -79,3 +83,154 @@ class TestBackTest(unittest.TestCase):
         assert_almost_equal(1.17, self.backtest.net)
         self.backtest.cost = lambda trade: 0.5 * trade / 100
         assert_almost_equal(0.16, self.backtest.net, 2)
+
+    def test_trades_assignment_builds_ledger(self):
+        self.backtest.trades = [Trade('buy', self.goog[0]),
+                                Trade('sell', self.goog[10])]
+        self.assertEqual(2, len(self.backtest.trades))
+        self.assertEqual('sell', self.backtest.trades[-1].order)
+        self.assertEqual(1, self.backtest._position(9, True))
+        self.assertEqual(0, self.backtest._position(10, True))
+
+    def test_ledger_arrays_match_queries(self):
+        self.backtest(self.goog, Bollinger(30, 1))
+        self.backtest.cost = lambda trade: 0.5 * trade / 100
+        ticks = numpy.arange(len(self.goog))
+        position, gross, cost = self.backtest.trades.at(ticks,
+                                                        self.backtest.cost)
+        for index in (0, 28, 29, 500, 1957):
+            self.assertEqual(self.backtest._position(index, True),
+                             position[index])
+            self.assertEqual(self.backtest._gross(index), gross[index])
+            self.assertEqual(self.backtest._trade_cost(index), cost[index])
+
+    def test_ledger_records(self):
+        self.backtest(self.goog, Bollinger(30, 1))
+        self.backtest.cost = lambda trade: 0.5 * trade / 100
+        trades = self.backtest.trades
+        records = numpy.asarray(trades)
+        self.assertTrue(numpy.may_share_memory(records, trades.array))
+        self.assertEqual([(t.order, t.tick.index) for t in trades],
+                         zip([Ledger.orders[side] for side in records['side']],
+                             records['tick']))
+        self.assertEqual(list(self.goog.close[records['tick']]),
+                         list(records['price']))
+        appended = Ledger(list(trades))
+        self.assertEqual(records.tolist(), appended.array.tolist())
+        self.assertEqual(trades.gross(1957), appended.gross(1957))
+        net = self.backtest.net
+        self.assertAlmostEqual(self.backtest.trade_cost, records['cost'].sum())
+        filename = os.path.join(tempfile.mkdtemp(), 'trades.npy')
+        trades.dump(filename)
+        self.backtest.trades = Ledger.load(filename, self.goog)
+        self.assertEqual(net, self.backtest.net)
+        self.assertEqual(trades[5], self.backtest.trades[5])
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+
+    def test_execute_follows_position_rules(self):
+        random = numpy.random.RandomState(0)
+        for size in (0, 1, 5, 100):
+            signals = random.randint(-1, 2, size)
+            position, expected = 0, []
+            for index, signal in enumerate(signals):
+                if signal == 1 and position != 1 or \
+                        signal == -1 and position != -1:
+                    position += signal
+                    expected.append((index, signal))
+            indices, sides = execute(signals)
+            self.assertEqual(expected, zip(indices, sides))
+
+    def test_vectorized_bollinger_matches_per_tick(self):
+        for n, k in ((30, 1), (20, 2), (2, 1)):
+            bollinger = Bollinger(n, k)
+            vectorized = BackTest()(self.goog, bollinger)
+            per_tick = BackTest()(self.goog, lambda tick: bollinger(tick))
+            self.assertEqual([(t.order, t.tick.index) for t in per_tick.trades],
+                             [(t.order, t.tick.index)
+                              for t in vectorized.trades])
+            self.assertEqual(per_tick.net, vectorized.net)
+            self.assertEqual(per_tick.signals.tolist(),
+                             vectorized.signals.tolist())
+
+    def test_bollinger_matches_baseline(self):
+        # Tick of a plain list compute their indicators with numpy.mean and
+        # numpy.std over slices of the list, as before Stock.rolling
+        ticks = []
+        ticks.extend(Tick(ticks, index, *bar)
+                     for index, bar in enumerate(self.goog.bars()))
+        for n, k in ((2, 1), (10, 0), (30, 1), (20, 2)):
+            bollinger = Bollinger(n, k)
+            expected, position = [], 0
+            for tick in ticks:
+                signal = bollinger(tick)
+                if signal == 'buy' and position != 1:
+                    expected.append(('buy', tick.index))
+                    position += 1
+                elif signal == 'sell' and position != -1:
+                    expected.append(('sell', tick.index))
+                    position -= 1
+            gross = sum(ticks[index].close * (1 if order == 'sell' else -1)
+                        for order, index in expected)
+            net = gross + position * ticks[-1].close
+            for strategy in (bollinger, lambda tick: bollinger(tick)):
+                backtest = BackTest()(self.goog, strategy)
+                self.assertEqual(expected, [(t.order, t.tick.index)
+                                            for t in backtest.trades])
+                self.assertEqual(gross, backtest.gross)
+                self.assertEqual(net, backtest.net)
+
+    def test_strategy_called_once_per_tick(self):
+        calls = []
+        def strategy(tick):
+            calls.append(tick.index)
+            return 'sell' if tick.index % 3 else None
+        backtest = BackTest()(self.goog, strategy)
+        self.assertEqual(calls, range(len(self.goog)))
+        self.assertEqual(backtest.signals.tolist()[:4], [0, -1, -1, 0])
+        self.assertEqual([t.tick.index for t in backtest.trades], [1])
+        self.assertIsNone(BackTest().signals)
+
+    def test_stream_replay_matches_batch(self):
+        cost = lambda trade: 0.5 * trade / 100
+        for n, k in ((30, 1), (20, 2)):
+            batch = BackTest()
+            batch.cost = cost
+            batch(self.goog, Bollinger(n, k))
+            live = BackTest()
+            live.cost = cost
+            for index, backtest in enumerate(
+                    live.stream(Stock(), Bollinger(n, k), self.goog.bars())):
+                self.assertEqual(batch._position(index, True),
+                                 backtest._position(index, True))
+                self.assertEqual(batch._net(index), backtest.net)
+            self.assertEqual([(t.order, t.tick.index) for t in batch.trades],
+                             [(t.order, t.tick.index) for t in live.trades])
+            self.assertEqual((batch.position, batch.gross, batch.net),
+                             (live.position, live.gross, live.net))
+            self.assertEqual(batch.signals.tolist(), live.signals.tolist())
+
+    def test_execute_from_position(self):
+        random = numpy.random.RandomState(1)
+        for position in (-1, 0, 1):
+            for size in (0, 1, 5, 100):
+                signals = random.randint(-1, 2, size)
+                current, expected = position, []
+                for index, signal in enumerate(signals):
+                    if signal == 1 and current != 1 or \
+                            signal == -1 and current != -1:
+                        current += signal
+                        expected.append((index, signal))
+                indices, sides = execute(signals, position)
+                self.assertEqual(expected, zip(indices, sides))
+
+    def test_chunked_signals_match_whole_stock(self):
+        for n, k in ((30, 1), (20, 2)):
+            whole = BackTest()(self.goog, Bollinger(n, k))
+            self.goog.chunk = 97
+            chunked = BackTest()(self.goog, Bollinger(n, k))
+            del self.goog.chunk
+            self.assertEqual([(t.order, t.tick.index) for t in whole.trades],
+                             [(t.order, t.tick.index) for t in chunked.trades])
+            self.assertEqual(whole.net, chunked.net)
+            self.assertEqual(whole.signals.tolist(), chunked.signals.tolist())
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+from bench import suite
+from bench.suite import run, compare, synthetic
+
+
+def failing(size):
+    raise ValueError('broken benchmark')
+
+def exiting(size):
+    os._exit(3)
+
+class TestBench(unittest.TestCase):
+
+    def test_synthetic(self):
+        stock = synthetic(1000)
+        self.assertEqual(1000, len(stock))
+        self.assertTrue((stock.low <= stock.close).all())
+        self.assertTrue((stock.close <= stock.high).all())
+
+    def test_run(self):
+        results = run(['parse'])
+        self.assertEqual(['parse'], results.keys())
+        self.assertEqual(1958, results['parse']['fixture']['items'])
+
+    def test_run_reports_errors(self):
+        benchmarks = suite.BENCHMARKS
+        suite.BENCHMARKS = [('failing', failing, False),
+                            ('exiting', exiting, False)]
+        try:
+            results = run()
+        finally:
+            suite.BENCHMARKS = benchmarks
+        self.assertIn('ValueError: broken benchmark',
+                      results['failing']['fixture']['error'])
+        self.assertIn('exited with code 3',
+                      results['exiting']['fixture']['error'])
+        self.assertEqual([], compare(results, {'failing': {'fixture': {}}}))
+
+    def test_compare(self):
+        baseline = {'pnl': {'10': {'throughput': 100.0, 'memory': 10.0}}}
+        results = {'pnl': {'10': {'throughput': 80.0, 'memory': 12.0}}}
+        self.assertEqual([], compare(results, baseline, 0.3))
+        results['pnl']['10']['throughput'] = 60.0
+        results['pnl']['10']['memory'] = 14.0
+        self.assertEqual(2, len(compare(results, baseline, 0.3)))
+        self.assertEqual([], compare(results, {}, 0.3))
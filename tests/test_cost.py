@@ -0,0 +1,74 @@
+import unittest
+import datetime
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+from lib.stock import Stock
+from lib.backtest import BackTest
+from lib.cost import Cost, trade_costs
+from strategy import Bollinger
+from test_helpers import get_historical_prices, raise_if_called, NewDate, \
+    clear_cache
+
+class TestCost(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.backtest = BackTest()(self.goog, Bollinger(30, 1))
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def test_components(self):
+        amounts = numpy.array([100.0, 400.0, 900.0])
+        volumes = numpy.array([100, 10000, 0])
+        self.assertEqual([2.0] * 3, Cost(fixed=2)(amounts).tolist())
+        assert_almost_equal([0.1, 0.4, 0.9], Cost(bps=10)(amounts))
+        assert_almost_equal([10.0, 4.0, 0.0], Cost(slippage=1)(amounts, volumes))
+        self.assertEqual([3, 3, 3], Cost(minimum=3)(amounts).tolist())
+        self.assertEqual(0, Cost()(100))
+
+    def test_matches_legacy_function(self):
+        legacy = lambda trade: 0.5 * trade / 100
+        self.backtest.cost = legacy
+        net = self.backtest.net
+        self.backtest.cost = Cost(bps=50)
+        assert_almost_equal(net, self.backtest.net, 8)
+        assert_almost_equal(self.backtest.trade_cost,
+                            self.backtest.trades.trade_costs(legacy).sum(), 8)
+
+    def test_parameter_change_invalidates_costs(self):
+        cost = Cost(fixed=1)
+        self.backtest.cost = cost
+        self.assertEqual(len(self.backtest.trades), self.backtest.trade_cost)
+        cost.fixed = 2
+        self.assertEqual(2 * len(self.backtest.trades),
+                         self.backtest.trade_cost)
+
+    def test_slippage_uses_trade_volume(self):
+        self.backtest.cost = Cost(slippage=0.5)
+        expected = sum(0.5 * trade.tick.close / trade.tick.volume ** 0.5
+                       for trade in self.backtest.trades)
+        assert_almost_equal(expected, self.backtest.trade_cost, 8)
+
+    def test_sensitivity_reuses_trades(self):
+        costs = [Cost(fixed, bps, slippage, minimum)
+                 for fixed in (0, 1) for bps in (0, 10, 50)
+                 for slippage in (0, 0.2) for minimum in (0, 1.5)]
+        self.backtest.strategy = raise_if_called
+        nets = self.backtest.sensitivity(costs)
+        self.assertEqual(len(costs), len(nets))
+        for cost, net in zip(costs, nets):
+            self.backtest.cost = cost
+            assert_almost_equal(self.backtest.net, net, 8)
+
+    def test_trade_costs_of_function(self):
+        self.assertEqual([1.0, 2.0], trade_costs(lambda trade: trade / 100,
+                                                 [100.0, 200.0], [1, 1])
+                         .tolist())
+        self.assertEqual(0, len(trade_costs(Cost(fixed=1), [], [])))
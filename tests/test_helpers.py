@@ -1,6 +1,9 @@
 import unittest
 import datetime
 import cPickle as pickle
+import os
+
+from lib import store
 
 
 def get_historical_prices(*args):
@@ -11,6 +14,12 @@ def get_historical_prices(*args):
 def raise_if_called(*args):
     raise Exception
 
+def clear_cache(symbol):
+    """ remove symbol from the binary store and its legacy pickle """
+    store.remove(symbol)
+    if os.path.exists('cache/{0}_2012-05-25'.format(symbol)):
+        os.remove('cache/{0}_2012-05-25'.format(symbol))
+
 class NewDate(datetime.date):
     """ class to mock datetime.date.today """
     @classmethod
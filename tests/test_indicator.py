@@ -0,0 +1,200 @@
+import unittest
+import datetime
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+from lib import indicator
+from lib.indicator import Rolling, INDICATORS, exponential, parse
+from lib.stock import Stock
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestRolling(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.rolling = Rolling(self.goog.close)
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def test_matches_numpy(self):
+        close = self.goog.close
+        for n in (1, 2, 30, 200):
+            for index in (n - 1, n + 10, len(close) - 1):
+                window = close[index+1-n:index+1]
+                self.assertEqual(numpy.mean(window),
+                                 self.rolling.ma_at(index, n))
+                self.assertEqual(numpy.std(window),
+                                 self.rolling.std_at(index, n))
+
+    def test_short_window_is_nan(self):
+        self.assertTrue(numpy.isnan(self.rolling.ma_at(28, 30)))
+        self.assertTrue(numpy.isnan(self.rolling.std_at(28, 30)))
+        self.assertTrue(numpy.isnan(self.rolling.ma_at(10, 0)))
+        self.assertTrue(numpy.isnan(self.rolling.ma(30)[:29]).all())
+        self.assertFalse(numpy.isnan(self.rolling.ma(30)[29:]).any())
+        self.assertTrue(numpy.isnan(self.rolling.std(5000)).all())
+
+    def test_arrays_match_lookups(self):
+        for n in (2, 30):
+            ma, std = self.rolling.ma(n), self.rolling.std(n)
+            for index in xrange(n - 1, len(self.goog)):
+                self.assertEqual(ma[index], self.rolling.ma_at(index, n))
+                self.assertEqual(std[index], self.rolling.std_at(index, n))
+
+    def test_arrays_computed_once(self):
+        self.assertIs(self.rolling.ma(30), self.rolling.ma(30))
+        self.assertIs(self.goog.std(30), self.goog.std(30))
+
+    def test_tick_uses_stock_rolling(self):
+        tick = self.goog[100]
+        self.assertEqual(self.goog.ma(30)[100], tick.ma(30))
+        self.assertEqual(self.goog.upper_bb(30, 1)[100], tick.upper_bb(30, 1))
+        self.assertEqual(self.goog.lower_bb(30, 1)[100], tick.lower_bb(30, 1))
+
+    def test_windows_match_arrays(self):
+        close = self.goog.close.copy()
+        close[[0, 1, 500]] = numpy.nan
+        ns = [0, 1, 2, 30, 200, 5000]
+        for rolling in (self.rolling, Rolling(close),
+                        self.rolling.window(100, 900)):
+            ma, std = rolling.windows(ns)
+            self.assertEqual((len(rolling), len(ns)), ma.shape)
+            for column, n in enumerate(ns):
+                numpy.testing.assert_array_equal(rolling.ma(n), ma[:, column])
+                numpy.testing.assert_array_equal(rolling.std(n),
+                                                 std[:, column])
+
+    def test_columns_match_series(self):
+        close = self.goog.close
+        columns = numpy.column_stack([close, close[::-1], close * 2])
+        cells, indicator._CELLS = indicator._CELLS, 100
+        try:
+            for n in (1, 9, 30, 200):
+                ma, std = Rolling(columns).ma(n), Rolling(columns).std(n)
+                for column in xrange(columns.shape[1]):
+                    rolling = Rolling(columns[:, column].copy())
+                    numpy.testing.assert_array_equal(rolling.ma(n),
+                                                     ma[:, column])
+                    numpy.testing.assert_array_equal(rolling.std(n),
+                                                     std[:, column])
+        finally:
+            indicator._CELLS = cells
+
+    def test_append_matches_whole_series(self):
+        close = self.goog.close.copy()
+        close[[0, 1, 500]] = numpy.nan
+        for values in (self.goog.close, close):
+            rolling = Rolling([])
+            for n in (0, 2, 30):
+                rolling.ma(n), rolling.std(n)
+            for value in values.tolist():
+                rolling.append(value)
+            expected = Rolling(values)
+            numpy.testing.assert_array_equal(expected.values, rolling.values)
+            for n in (0, 2, 30, 200):
+                numpy.testing.assert_array_equal(expected.ma(n), rolling.ma(n))
+                numpy.testing.assert_array_equal(expected.std(n),
+                                                 rolling.std(n))
+
+
+class TestIndicators(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.close = self.goog.close.tolist()
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def test_parse(self):
+        self.assertEqual(('upper_bb', (30, 1)), parse('upper_bb(30, 1)'))
+        self.assertEqual(('ma', (30,)), parse(' ma ( 30 ) '))
+        self.assertEqual(('close', ()), parse('close'))
+        self.assertRaises(ValueError, parse, 'ma(30')
+
+    def test_evaluate(self):
+        self.assertIs(self.goog.close, self.goog.evaluate('close'))
+        self.assertIs(self.goog.upper_bb(30, 1),
+                      self.goog.evaluate('upper_bb(30, 1.0)'))
+        self.assertRaises(KeyError, self.goog.evaluate, 'unknown(1)')
+
+    def test_shared_subexpressions(self):
+        calls = []
+        ma = INDICATORS['ma']
+        def counting_ma(series, n):
+            calls.append(n)
+            return ma(series, n)
+        INDICATORS['ma'] = counting_ma
+        try:
+            self.goog.evaluate('upper_bb(30, 1)')
+            self.goog.evaluate('lower_bb(30, 1)')
+            self.goog.evaluate('lower_bb(30, 2)')
+            self.goog.evaluate('ma(30)')
+        finally:
+            INDICATORS['ma'] = ma
+        self.assertEqual([30], calls)
+
+    def test_set_columns_resets_values(self):
+        ma = self.goog.ma(30)
+        self.goog.set_columns([getattr(self.goog, field)
+                               for field in Stock.fields])
+        self.assertIsNot(ma, self.goog.ma(30))
+
+    def test_ema(self):
+        alpha = 2.0 / 31
+        expected = [self.close[0]]
+        for value in self.close[1:]:
+            expected.append((1 - alpha) * expected[-1] + alpha * value)
+        assert_almost_equal(expected, self.goog.ema(30), 9)
+        assert_almost_equal(self.close, exponential(self.close, 1.0), 12)
+        assert_almost_equal([[1.0, 2.0], [2.0, 3.0], [2.5, 3.5]],
+                            exponential([[1.0, 2.0], [3.0, 4.0], [3.0, 4.0]],
+                                        0.5), 12)
+
+    def test_rsi(self):
+        n = 14
+        changes = numpy.diff(self.close)
+        gain = numpy.maximum(changes[:n], 0).mean()
+        loss = numpy.maximum(-changes[:n], 0).mean()
+        expected = [100 - 100 / (1 + gain / loss)]
+        for change in changes[n:]:
+            gain = (gain * (n - 1) + max(change, 0)) / n
+            loss = (loss * (n - 1) + max(-change, 0)) / n
+            expected.append(100 - 100 / (1 + gain / loss))
+        rsi = self.goog.rsi(n)
+        self.assertTrue(numpy.isnan(rsi[:n]).all())
+        assert_almost_equal(expected, rsi[n:], 8)
+
+    def test_atr(self):
+        n = 14
+        high, low = self.goog.high.tolist(), self.goog.low.tolist()
+        ranges = [high[0] - low[0]]
+        for index in xrange(1, len(high)):
+            ranges.append(max(high[index], self.close[index - 1]) -
+                          min(low[index], self.close[index - 1]))
+        expected = [sum(ranges[:n]) / n]
+        for value in ranges[n:]:
+            expected.append((expected[-1] * (n - 1) + value) / n)
+        atr = self.goog.atr(n)
+        self.assertTrue(numpy.isnan(atr[:n-1]).all())
+        assert_almost_equal(expected, atr[n-1:], 9)
+
+    def test_rolling_extremes(self):
+        for n in (1, 2, 7, 30, len(self.close)):
+            lowest, highest = self.goog.rolling_min(n), self.goog.rolling_max(n)
+            self.assertTrue(numpy.isnan(lowest[:n-1]).all())
+            for index in xrange(n - 1, len(self.close), 37):
+                window = self.close[index+1-n:index+1]
+                self.assertEqual(min(window), lowest[index])
+                self.assertEqual(max(window), highest[index])
+        self.assertTrue(numpy.isnan(self.goog.rolling_max(5000)).all())
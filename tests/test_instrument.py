@@ -0,0 +1,118 @@
+import unittest
+import datetime
+import functools
+import json
+import os
+import pstats
+import tempfile
+from StringIO import StringIO
+
+from lib import instrument
+from lib.stock import Stock
+from lib.tick import Tick
+from lib.backtest import BackTest
+from strategy import Bollinger
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.std = Tick.__dict__['std']
+        self.cast = Stock.__dict__['cast']
+        self.net = BackTest.__dict__['net']
+        instrument.enable()
+        clear_cache('GOOG')
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+
+    def tearDown(self):
+        instrument.disable()
+        datetime.date = self.built_in_date
+        clear_cache('GOOG')
+
+    def test_disable(self):
+        self.assertTrue(instrument.enabled())
+        self.assertNotEqual(Tick.__dict__['std'], self.std)
+        BackTest()(self.goog, Bollinger(30, 1))
+        instrument.disable()
+        self.assertFalse(instrument.enabled())
+        self.assertEqual(Tick.__dict__['std'], self.std)
+        self.assertEqual(Stock.__dict__['cast'], self.cast)
+        self.assertEqual(BackTest.__dict__['net'], self.net)
+        self.assertFalse(getattr(Bollinger.__call__, 'instrumented', False))
+        self.assertFalse(getattr(Bollinger.signals, 'instrumented', False))
+
+    def test_load(self):
+        counters = instrument.counters()
+        self.assertEqual(counters['stock.load']['calls'], 1)
+        self.assertEqual(counters['stock.parse']['calls'], 1)
+        self.assertEqual(counters['cache.save']['calls'], 1)
+        loads = counters['cache.load']['calls']
+        goog = Stock('GOOG', get_historical_prices)
+        self.assertEqual(instrument.counters()['stock.load']['calls'], 1)
+        len(goog)
+        counters = instrument.counters()
+        self.assertEqual(counters['stock.load']['calls'], 2)
+        self.assertEqual(counters['cache.load']['calls'], loads + 1)
+        self.assertEqual(counters['stock.parse']['calls'], 1)
+
+    def test_stats(self):
+        def strategy(tick):
+            if tick.index >= 10:
+                return 'buy' if tick.close < tick.ma(10) - tick.std(10) \
+                    else 'sell'
+        backtest = BackTest()(self.goog, strategy)
+        stats = backtest.stats
+        calls = stats['strategy.call']['calls']
+        self.assertEqual(calls, len(self.goog))
+        self.assertEqual(stats['tick.std']['calls'], calls - 10)
+        self.assertEqual(stats['backtest.run']['calls'], 1)
+        self.assertNotIn('stock.load', stats)
+        backtest.net
+        self.assertEqual(stats['backtest.net']['calls'], 1)
+
+        backtest = BackTest()(self.goog, Bollinger(30, 1))
+        self.assertEqual(backtest.stats['strategy.signals']['calls'], 1)
+        self.assertNotIn('tick.std', backtest.stats)
+
+    def test_c_callable_strategy(self):
+        def strategy(n, tick):
+            return 'buy' if tick.index % n else 'sell'
+        backtest = BackTest()(self.goog, functools.partial(strategy, 2))
+        self.assertEqual(backtest.stats['strategy.call']['calls'],
+                         len(self.goog))
+        self.assertFalse(getattr(functools.partial.__call__, 'instrumented',
+                                 False))
+
+    def test_keyword_call(self):
+        timed = instrument._timed('keyword', lambda value=None: value)
+        self.assertEqual(1, timed(value=1))
+        self.assertEqual(instrument.counters()['keyword']['calls'], 1)
+
+    def test_dump(self):
+        backtest = BackTest()(self.goog, Bollinger(30, 1))
+        f = StringIO()
+        instrument.dump(f, backtest)
+        report = json.loads(f.getvalue())
+        self.assertEqual(report['counters']['stock.load']['calls'], 1)
+        self.assertEqual(report['backtest']['strategy.signals']['calls'], 1)
+
+    def test_profiled(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'backtest.prof')
+        with instrument.profiled(filename) as profile:
+            BackTest()(self.goog, Bollinger(30, 1))
+        functions = [function for _, _, function
+                     in pstats.Stats(filename).stats]
+        self.assertIn('signals', functions)
+        self.assertTrue(pstats.Stats(profile).total_calls)
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+
+    def test_sampled(self):
+        with instrument.sampled(0.001) as samples:
+            bollinger = Bollinger(30, 1)
+            for _ in range(5):
+                BackTest()(self.goog, lambda tick: bollinger(tick))
+        self.assertTrue(sum(samples.values()) > 0)
@@ -0,0 +1,90 @@
+import unittest
+import datetime
+from functools import partial
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+from lib.stock import Stock
+from lib.backtest import BackTest
+from lib.cost import Cost
+from lib.montecarlo import seeded, bootstrap, simulate, distribution, rank
+from strategy import Bollinger, Monkey
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.cost = Cost(bps=50)
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def backtest(self, stock, strategy):
+        backtest = BackTest()
+        backtest.cost = self.cost
+        return backtest(stock, strategy)
+
+    def test_monkey_is_reproducible(self):
+        monkey = Monkey(7, seed=3)
+        vectorized = BackTest()(self.goog, monkey)
+        per_tick = BackTest()(self.goog, lambda tick: Monkey(7, seed=3)(tick))
+        self.assertEqual([(t.order, t.tick.index) for t in per_tick.trades],
+                         [(t.order, t.tick.index) for t in vectorized.trades])
+        self.assertEqual(list(monkey.signals(self.goog)),
+                         list(Monkey(7, seed=3).signals(self.goog)))
+        self.assertNotEqual(list(monkey.signals(self.goog)),
+                            list(Monkey(7, seed=4).signals(self.goog)))
+
+    def test_seeded_matches_backtests(self):
+        chance = seeded(partial(Monkey, 30), self.goog, runs=25, seed=10,
+                        cost=self.cost, batch=10, processes=1)
+        self.assertEqual(25, len(chance.net))
+        for index in (0, 9, 10, 24):
+            backtest = self.backtest(self.goog, Monkey(30, seed=10 + index))
+            assert_almost_equal(backtest.net, chance.net[index], 8)
+        self.assertEqual(list(chance.net),
+                         list(seeded(partial(Monkey, 30), self.goog, runs=25,
+                                     seed=10, cost=self.cost,
+                                     processes=2).net))
+
+    def test_bootstrap(self):
+        paths = bootstrap(self.goog, 20, block=10, seed=1)
+        self.assertEqual((1958, 20), paths.close.shape)
+        self.assertTrue((paths.close[0] == self.goog.close[0]).all())
+        returns = numpy.diff(numpy.log(self.goog.close))
+        resampled = numpy.diff(numpy.log(paths.close), axis=0)
+        self.assertTrue(numpy.in1d(numpy.round(resampled, 10),
+                                   numpy.round(returns, 10)).all())
+        self.assertEqual(list(paths.close[:, 5]),
+                         list(bootstrap(self.goog, 1, 10, seed=6).close[:, 0]))
+
+    def test_simulate_matches_backtests(self):
+        bollinger = Bollinger(30, 1)
+        chance = simulate(bollinger, self.goog, paths=12, block=10, seed=1,
+                          cost=self.cost, batch=5, processes=1)
+        paths = bootstrap(self.goog, 12, block=10, seed=1)
+        for index in (0, 5, 11):
+            close = paths.close[:, index]
+            stock = Stock()
+            stock.set_columns([self.goog.date, close, close, close, close,
+                               self.goog.volume, close])
+            assert_almost_equal(self.backtest(stock, bollinger).net,
+                                chance.net[index], 8)
+        self.assertEqual(list(chance.net),
+                         list(simulate(bollinger, self.goog, paths=12,
+                                       block=10, seed=1, cost=self.cost,
+                                       processes=2).net))
+
+    def test_distribution(self):
+        result = distribution(numpy.arange(101.0))
+        self.assertEqual({5: 5.0, 25: 25.0, 50: 50.0, 75: 75.0, 95: 95.0},
+                         result.percentiles)
+        self.assertTrue(numpy.isnan(distribution([]).percentiles[50]))
+        self.assertEqual(50.0, rank(2.5, [1, 2, 3, 4]))
+        self.assertEqual(0.0, rank(1, []))
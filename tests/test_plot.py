@@ -0,0 +1,77 @@
+import unittest
+import datetime
+import os
+import subprocess
+import sys
+
+import numpy
+
+from lib import plot
+from lib.stock import Stock
+from lib.backtest import BackTest
+from strategy import Bollinger
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.files = []
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+        for filename in self.files:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_import_without_matplotlib(self):
+        imported = subprocess.check_output([sys.executable, '-c', '''
+import sys
+from lib import Stock, BackTest
+print any(name.startswith('matplotlib') for name in sys.modules)
+'''])
+        self.assertEqual('False', imported.strip())
+
+    def test_decimate_keeps_extremes(self):
+        random = numpy.random.RandomState(0)
+        y = random.normal(size=100003)
+        x = numpy.arange(len(y))
+        decimated_x, decimated_y = plot.decimate(x, y, 800)
+        self.assertTrue(len(decimated_y) <= 4 * 801 + 1000)
+        self.assertEqual(y.min(), decimated_y.min())
+        self.assertEqual(y.max(), decimated_y.max())
+        self.assertEqual(list(y[decimated_x]), list(decimated_y))
+        self.assertEqual((0, len(y) - 1), (decimated_x[0], decimated_x[-1]))
+        self.assertEqual(10, len(plot.decimate(x[:10], y[:10], 800)[0]))
+
+    def test_dates(self):
+        date = numpy.array(['1970-01-01', '2012-05-25'], dtype='M8[D]')
+        self.assertEqual([719163.0, 734648.0], plot.dates(date).tolist())
+
+    def test_stock_plot(self):
+        function, args = self.goog.chart('close', 'upper_bb(30, 1)')
+        self.assertEqual('png/GOOG.png', args[0])
+        self.assertEqual(list(self.goog.upper_bb(30, 1)[29:]),
+                         list(args[2][1][1][29:]))
+        self.files.append('png/GOOG.png')
+        datetime.date = self.built_in_date  # matplotlib needs the real date
+        self.goog.plot('close', 'upper_bb(30, 1)', 'lower_bb(30, 1)')
+        self.assertTrue(os.path.getsize('png/GOOG.png'))
+
+    def test_render_many(self):
+        charts = []
+        for n in (20, 30):
+            backtest = BackTest()(self.goog, Bollinger(n, 1))
+            function, args = backtest.chart()
+            args = ('png/GOOG_{0}.png'.format(n),) + args[1:]
+            charts.append((function, args))
+        self.files.extend(args[0] for function, args in charts)
+        datetime.date = self.built_in_date
+        self.assertEqual(['png/GOOG_20.png', 'png/GOOG_30.png'],
+                         plot.render_many(charts, processes=2))
+        for function, args in charts:
+            self.assertTrue(os.path.getsize(args[0]))
@@ -0,0 +1,79 @@
+import unittest
+import datetime
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+from lib.backtest import BackTest
+from lib.portfolio import Portfolio
+from lib.stock import Stock
+from strategy import Bollinger
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestPortfolio(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        # listed later, priced differently and missing a date
+        self.late = Stock()
+        self.late.symbol = 'LATE'
+        keep = numpy.arange(1000, len(self.goog)) != 1500
+        self.late.set_columns([getattr(self.goog, field)[1000:][keep]
+                               for field in Stock.fields])
+        self.late.close = self.late.close * 1.5
+        self.cost = lambda trade: 0.5 * trade / 100
+        self.portfolio = Portfolio([self.goog, self.late])
+        self.portfolio.cost = self.cost
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def test_alignment(self):
+        self.assertEqual((1958, 2), self.portfolio.close.shape)
+        self.assertTrue(numpy.isnan(self.portfolio.close[:1000, 1]).all())
+        self.assertEqual(self.portfolio.close[1499, 1],
+                         self.portfolio.close[1500, 1])
+        self.assertEqual(0, self.portfolio.volume[1500, 1])
+        self.assertEqual(list(self.goog.close),
+                         list(self.portfolio.close[:, 0]))
+
+    def test_matches_backtest_per_stock(self):
+        self.portfolio(Bollinger(30, 1))
+        goog = BackTest()(self.goog, Bollinger(30, 1))
+        goog.cost = self.cost
+        self.assertEqual(len(goog.trades),
+                         (self.portfolio.columns == 0).sum())
+        self.assertEqual(goog.position, self.portfolio.position[0])
+        self.assertEqual(goog.gross, self.portfolio.gross[0])
+        self.assertEqual(goog.net, self.portfolio.net[0])
+        net = self.portfolio.net_pnl[:, 0]
+        for index in (0, 100, 1000, 1957):
+            self.assertEqual(goog._net(index), net[index])
+
+    def test_gap_and_late_listing(self):
+        self.portfolio(Bollinger(30, 1))
+        late = BackTest()(self.late, Bollinger(30, 1))
+        late.cost = self.cost
+        self.assertEqual([t.tick.date for t in late.trades],
+                         self.portfolio.date[self.portfolio.ticks[
+                             self.portfolio.columns == 1]].tolist())
+        assert_almost_equal(late.net, self.portfolio.net[1])
+        self.assertEqual(0, self.portfolio.positions[:1029, 1].any())
+
+    def test_indicators_of_late_listing(self):
+        listed = Stock()
+        listed.set_columns([self.portfolio.date[1000:]] +
+                           [getattr(self.portfolio, field)[1000:, 1]
+                            for field in Stock.fields[1:]])
+        for expression in ('ma(30)', 'ema(30)', 'rsi(14)', 'atr(14)',
+                           'rolling_min(30)'):
+            values = self.portfolio.evaluate(expression)
+            self.assertTrue(numpy.isnan(values[:1000, 1]).all())
+            numpy.testing.assert_array_equal(listed.evaluate(expression),
+                                             values[1000:, 1])
+            numpy.testing.assert_array_equal(self.goog.evaluate(expression),
+                                             values[:, 0])
@@ -0,0 +1,130 @@
+import unittest
+import datetime
+import functools
+import os
+import shutil
+import tempfile
+
+from lib import results, store
+from lib.stock import Stock
+from lib.cost import Cost
+from lib.sweep import sweep
+from strategy import Bollinger, Monkey
+from test_helpers import get_historical_prices, NewDate
+
+class Private(object):
+    """ strategy keeping its parameter in a private attribute """
+
+    def __init__(self, n):
+        self._n = n
+
+    def __call__(self, tick):
+        return 'buy' if tick.index % self._n else 'sell'
+
+
+class TestResults(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.cache, store.CACHE = store.CACHE, tempfile.mkdtemp()
+        self.goog = Stock('GOOG', get_historical_prices)
+        self.cost = Cost(bps=50)
+        self.calls = []
+        self.signals = Bollinger.signals
+        calls = self.calls
+        def signals(strategy, stock):
+            calls.append((strategy.n, strategy.k))
+            return self.signals(strategy, stock)
+        Bollinger.signals = signals
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+        Bollinger.signals = self.signals
+        shutil.rmtree(store.CACHE)
+        store.CACHE = self.cache
+
+    def test_key(self):
+        key = results.key(self.goog, Bollinger(30, 1), self.cost)
+        self.assertEqual(key, results.key(self.goog, Bollinger(30, 1),
+                                          Cost(bps=50)))
+        self.assertNotEqual(key, results.key(self.goog, Bollinger(30, 2),
+                                             self.cost))
+        self.assertNotEqual(key, results.key(self.goog, Bollinger(30, 1),
+                                             Cost(bps=10)))
+        self.assertNotEqual(key, results.key(self.goog.window(0, 1000),
+                                             Bollinger(30, 1), self.cost))
+        self.assertNotEqual(key, results.key(self.goog, Monkey(30, 0),
+                                             self.cost))
+        self.assertIsNone(results.key(self.goog, lambda tick: None,
+                                      self.cost))
+        self.assertIsNone(results.key(self.goog, Bollinger(30, 1),
+                                      lambda trade: 0))
+
+    def test_key_of_unidentified_strategies(self):
+        strategies = [Bollinger(5, 1).__call__,
+                      functools.partial(Bollinger.__call__, Bollinger(5, 1)),
+                      Private(1), len]
+        for strategy in strategies:
+            self.assertIsNone(results.key(self.goog, strategy, self.cost))
+
+    def test_backtest_is_stored(self):
+        computed = results.backtest(self.goog, Bollinger(30, 1), self.cost)
+        loaded = results.backtest(self.goog, Bollinger(30, 1), self.cost)
+        self.assertEqual([(30, 1)], self.calls)
+        self.assertEqual([(t.order, t.tick) for t in computed.trades],
+                         [(t.order, t.tick) for t in loaded.trades])
+        self.assertEqual((computed.position, computed.gross, computed.net),
+                         (loaded.position, loaded.gross, loaded.net))
+        self.assertEqual((len(computed.trades), computed.position,
+                          computed.gross, computed.net),
+                         results.summary(self.goog, Bollinger(30, 1),
+                                         self.cost))
+        self.assertEqual(1, len(self.calls))
+
+    def test_sweep_runs_new_combinations_only(self):
+        grid = {'n': [10, 30], 'k': [1, 2]}
+        first = sweep(Bollinger, grid, [self.goog], self.cost, processes=1,
+                      cache=True)
+        self.assertEqual(4, len(self.calls))
+        grid['n'].append(20)
+        second = sweep(Bollinger, grid, [self.goog], self.cost, processes=1,
+                       cache=True)
+        self.assertEqual(6, len(self.calls))
+        self.assertEqual(first, [result for result in second
+                                 if result.parameters['n'] != 20])
+        self.assertEqual(second, sweep(Bollinger, grid, [self.goog],
+                                       self.cost, processes=1))
+
+    def test_save_evicts_past_the_limit(self):
+        calls = []
+        evict = results.evict
+        def counted(limit):
+            calls.append(limit)
+            return evict(limit)
+        results.evict = counted
+        try:
+            for n in (10, 20, 30):
+                results.backtest(self.goog, Bollinger(n, 1), self.cost)
+            self.assertEqual(1, len(calls))
+            size = os.path.getsize(results.path(
+                results.key(self.goog, Bollinger(30, 1), self.cost)))
+            key = results.key(self.goog, Bollinger(40, 1), self.cost)
+            results.save(key, [], [], results.Summary(0, None, 0.0, 0.0),
+                         limit=3 * size)
+            self.assertEqual(2, len(calls))
+        finally:
+            results.evict = evict
+
+    def test_evict_least_recently_used(self):
+        for n in (10, 20, 30):
+            results.backtest(self.goog, Bollinger(n, 1), self.cost)
+        keys = [results.key(self.goog, Bollinger(n, 1), self.cost)
+                for n in (10, 20, 30)]
+        for age, key in enumerate(keys):
+            os.utime(results.path(key), (1000 + age, 1000 + age))
+        results.load(keys[0])
+        size = os.path.getsize(results.path(keys[2]))
+        results.evict(2 * size + size // 2)
+        self.assertEqual([True, False, True],
+                         [os.path.exists(results.path(key)) for key in keys])
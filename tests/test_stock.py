@@ -3,9 +3,18 @@ import datetime
 import cPickle as pickle
 import shutil
 import os
+import threading
+import time
+import StringIO
+import tempfile
 
+import numpy
+
+from ext.ystockquote import parse_historical_prices
+from lib import store
 from lib.stock import Stock
-from test_helpers import get_historical_prices, raise_if_called, NewDate
+from test_helpers import get_historical_prices, raise_if_called, NewDate, \
+    clear_cache
 
 class TestStock(unittest.TestCase):
 
@@ -22,21 +31,302 @@ class TestStock(unittest.TestCase):
     def test_get_from_cache_available(self):
         shutil.copy('tests/fixtures/GOOG_2012-05-25', 'cache/GOOG_2012-05-25')
         self.assertIsNotNone(Stock.get_from_cache('GOOG'))
-        os.remove('cache/GOOG_2012-05-25')
+        clear_cache('GOOG')
+
+    def test_get_from_cache_memory_mapped(self):
+        len(Stock('GOOG', get_historical_prices))
+        columns = Stock.get_from_cache('GOOG')
+        self.assertIsInstance(columns[Stock.fields.index('close')],
+                              numpy.memmap)
+        self.assertEqual(1958, len(Stock('GOOG', raise_if_called).close))
+        clear_cache('GOOG')
+
+    def test_get_from_cache_outdated(self):
+        Stock.save_to_cache('GOOG', Stock.parse(get_historical_prices()))
+        datetime.date = self.built_in_date
+        self.assertIsNone(Stock.get_from_cache('GOOG'))
+        clear_cache('GOOG')
 
     def test_save_to_cache(self):
-        self.assertFalse(os.path.exists('cache/GOOG_2012-05-25'))
-        Stock.save_to_cache('GOOG', None)
-        self.assertTrue(os.path.exists('cache/GOOG_2012-05-25'))
-        os.remove('cache/GOOG_2012-05-25')
+        self.assertFalse(store.exists('GOOG'))
+        Stock.save_to_cache('GOOG', Stock.parse([[]]))
+        self.assertTrue(store.exists('GOOG'))
+        self.assertEqual(0, len(Stock.get_from_cache('GOOG')[0]))
+        clear_cache('GOOG')
 
     def test_instantiation_no_cache(self):
-        self.assertFalse(os.path.exists('cache/GOOG_2012-05-25'))
-        self.assertIsNotNone(Stock('GOOG', get_historical_prices))
-        self.assertTrue(os.path.exists('cache/GOOG_2012-05-25'))
-        os.remove('cache/GOOG_2012-05-25')
+        self.assertFalse(store.exists('GOOG'))
+        goog = Stock('GOOG', get_historical_prices)
+        self.assertFalse(store.exists('GOOG'))
+        self.assertEqual(1958, len(goog))
+        self.assertTrue(store.exists('GOOG'))
+        clear_cache('GOOG')
 
     def test_instantiation_with_cache(self):
         shutil.copy('tests/fixtures/GOOG_2012-05-25', 'cache/GOOG_2012-05-25')
         self.assertIsNotNone(Stock('GOOG', raise_if_called))
-        os.remove('cache/GOOG_2012-05-25')
+        clear_cache('GOOG')
+
+    def test_migrate_cache(self):
+        shutil.copy('tests/fixtures/GOOG_2012-05-25', 'cache/GOOG_2012-05-24')
+        shutil.copy('tests/fixtures/GOOG_2012-05-25', 'cache/GOOG_2012-05-25')
+        Stock.migrate_cache()
+        self.assertFalse(os.path.exists('cache/GOOG_2012-05-24'))
+        self.assertFalse(os.path.exists('cache/GOOG_2012-05-25'))
+        goog = Stock('GOOG', raise_if_called)
+        self.assertEqual(591.53, goog.close[-1])
+        self.assertEqual(datetime.date(2012, 5, 25), goog[-1].date)
+        clear_cache('GOOG')
+
+    def test_columns(self):
+        goog = Stock('GOOG', get_historical_prices)
+        len(goog)
+        clear_cache('GOOG')
+        self.assertEqual(1958, len(goog))
+        self.assertEqual('float64', goog.close.dtype)
+        self.assertEqual(100.34, goog.close[0])
+        self.assertEqual(591.53, goog.close[-1])
+        self.assertEqual(datetime.date(2004, 8, 19), goog[0].date)
+
+    def test_ticks_created_on_demand(self):
+        goog = Stock('GOOG', get_historical_prices)
+        len(goog)
+        clear_cache('GOOG')
+        tick = goog[-1]
+        self.assertEqual(1957, tick.index)
+        self.assertIs(goog, tick.series)
+        self.assertEqual(591.53, tick.close)
+        self.assertEqual([10, 11], [t.index for t in goog[10:12]])
+        self.assertEqual(len(goog), len(list(goog)))
+        self.assertRaises(IndexError, goog.__getitem__, 1958)
+
+    def test_date_slices(self):
+        goog = Stock('GOOG', get_historical_prices)
+        len(goog)
+        goog = Stock('GOOG', raise_if_called)
+        year = goog['2011-01-01':'2012-05-25']
+        self.assertIsInstance(year, Stock)
+        self.assertEqual(datetime.date(2011, 1, 3), year[0].date)
+        self.assertEqual(datetime.date(2012, 5, 25), year[-1].date)
+        self.assertTrue(numpy.may_share_memory(year.close, goog.close))
+        start, stop = goog.dates('2011-01-01', '2012-05-25')
+        self.assertEqual(list(goog.close[start:stop]), list(year.close))
+        self.assertEqual(len(goog), stop)
+        self.assertEqual(len(goog['2012-05':]), len(goog['2012-05-01':]))
+        self.assertEqual(year[-1].date,
+                         goog[:datetime.date(2012, 5, 25)][-1].date)
+        self.assertEqual(2, len(goog[:'2004-08-20']))
+        self.assertEqual(0, len(goog['2013':]))
+        self.assertEqual(29, numpy.isnan(year.ma(30)).sum())
+        clear_cache('GOOG')
+
+    def test_empty(self):
+        stock = Stock()
+        self.assertEqual(0, len(stock))
+        self.assertEqual([], list(stock))
+
+    def test_refresh_fetches_missing_days_only(self):
+        columns = Stock.parse(get_historical_prices())
+        store.save('GOOG', Stock.fields, [c[:1000] for c in columns],
+                   datetime.date(2008, 8, 8))
+        calls = []
+        def yahoo(symbol, start, end):
+            calls.append((symbol, start, end))
+            return get_historical_prices()
+        goog = Stock('GOOG', yahoo)
+        self.assertEqual([], calls)
+        self.assertEqual(1958, len(goog))
+        self.assertEqual([('GOOG', '20080808', '20120525')], calls)
+        self.assertEqual(list(columns[4]), list(goog.close))
+        self.assertEqual(1958, len(Stock('GOOG', raise_if_called)))
+        clear_cache('GOOG')
+
+    def test_load_many_concurrently(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'most': 0, 'failed': set()}
+        def yahoo(symbol, start, end):
+            with lock:
+                if symbol not in state['failed']:
+                    state['failed'].add(symbol)
+                    raise IOError
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            time.sleep(0.1)
+            with lock:
+                state['running'] -= 1
+            return get_historical_prices()
+        symbols = ['GOOG{0}'.format(i) for i in xrange(6)]
+        shutil.copy('tests/fixtures/GOOG_2012-05-25', 'cache/GOOG0_2012-05-25')
+        stocks = Stock.load_many(symbols, yahoo, threads=3, delay=0)
+        self.assertEqual(symbols, [stock.symbol for stock in stocks])
+        self.assertEqual([1958] * 6, [len(stock) for stock in stocks])
+        self.assertEqual(set(symbols[1:]), state['failed'])
+        self.assertEqual(3, state['most'])
+        for symbol in symbols:
+            clear_cache(symbol)
+
+    def test_load_many_duplicates(self):
+        calls = []
+        def yahoo(symbol, start, end):
+            calls.append(symbol)
+            time.sleep(0.05)
+            return get_historical_prices()
+        symbols = ['GOOG1', 'GOOG2', 'GOOG1', 'GOOG1']
+        stocks = Stock.load_many(symbols, yahoo, threads=4)
+        self.assertEqual(['GOOG1', 'GOOG2'], sorted(calls))
+        self.assertIs(stocks[0], stocks[2])
+        self.assertEqual(symbols, [stock.symbol for stock in stocks])
+        self.assertEqual(sorted(Stock.fields + ('meta',)),
+                         sorted(os.listdir('cache/GOOG1')))
+        for symbol in set(symbols):
+            clear_cache(symbol)
+
+    def test_parse_stream(self):
+        raw = get_historical_prices()
+        csv = StringIO.StringIO('\r\n'.join(','.join(row) for row in raw))
+        expected = Stock.parse(raw)
+        for chunk_size in (10, 1000, 1000000):
+            csv.seek(0)
+            columns = Stock.parse(parse_historical_prices(csv, chunk_size))
+            for column, expected_column in zip(columns, expected):
+                self.assertEqual(expected_column.dtype, column.dtype)
+                self.assertEqual(list(expected_column), list(column))
+
+    def test_parse_drops_malformed_rows(self):
+        csv = StringIO.StringIO(
+            'Date,Open,High,Low,Close,Volume,Adj Close\n'
+            '2012-05-25,601.00,601.73,588.28,591.53,3581900,591.53\n'
+            '2012-05-24,null,null,null,null,null,null\n'
+            '2012-05-23,601.00,601.73,588.28\n'
+            '2012-05-22,1,2,3,4,5,6,7\n'
+            'not a date,1,2,3,4,5,6\n'
+            '2012-05-21,600.00,600.50,590.00,595.00,3000000,595.00\n')
+        date, open_ = Stock.parse(parse_historical_prices(csv))[:2]
+        self.assertEqual(['2012-05-21', '2012-05-25'],
+                         [str(day) for day in date])
+        self.assertEqual([600.0, 601.0], list(open_))
+
+    def test_parse_empty(self):
+        columns = Stock.parse(parse_historical_prices(
+            StringIO.StringIO('Date,Open,High,Low,Close,Volume,Adj Close\n')))
+        self.assertEqual([0] * 7, [len(column) for column in columns])
+
+    def test_append_bars(self):
+        goog = Stock('GOOG', get_historical_prices)
+        stock = Stock()
+        stock.rolling
+        for bar in goog.bars():
+            stock.append(bar)
+            if len(stock) >= 30:
+                self.assertEqual(goog.ma(30)[len(stock) - 1], stock[-1].ma(30))
+        for field in Stock.fields:
+            self.assertEqual(list(getattr(goog, field)),
+                             list(getattr(stock, field)))
+        self.assertEqual(list(goog.upper_bb(30, 1)[29:]),
+                         list(stock.upper_bb(30, 1)[29:]))
+        clear_cache('GOOG')
+
+
+class TestIntraday(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        random = numpy.random.RandomState(0)
+        size = 1000
+        self.date = numpy.datetime64('2012-05-24T09:30:00') + \
+            numpy.cumsum(random.randint(1, 120, size)).astype('m8[s]')
+        self.close = 100 + numpy.cumsum(random.normal(0, 0.1, size)).round(2)
+        self.volume = random.randint(1, 1000, size).astype(float)
+        directory = tempfile.mkdtemp()
+        self.filename = os.path.join(directory, 'MINUTES.csv')
+        with open(self.filename, 'w') as f:
+            f.write('Date,Open,High,Low,Close,Volume\n')
+            for date, close, volume in zip(self.date.tolist(),
+                                           self.close.tolist(),
+                                           self.volume.tolist()):
+                f.write('{0},{1},{2},{3},{1},{4}\n'.format(
+                    date.strftime('%Y-%m-%d %H:%M:%S'), close, close + 0.5,
+                    close - 0.5, volume))
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+        shutil.rmtree(os.path.dirname(self.filename))
+        clear_cache('MINUTES')
+
+    def test_read(self):
+        stock = Stock.read(self.filename, chunk_size=1000)
+        self.assertEqual('MINUTES', stock.symbol)
+        self.assertEqual(numpy.dtype('M8[s]'), stock.date.dtype)
+        self.assertEqual(list(self.date), list(stock.date))
+        self.assertEqual(list(self.close), list(stock.close))
+        self.assertEqual(list(self.close), list(stock.adj))
+        self.assertEqual(list(self.volume), list(stock.volume))
+        self.assertIsInstance(stock.close.base, numpy.memmap)
+        self.assertEqual(self.date[5].item(), stock[5].date)
+        os.remove(self.filename)
+        self.assertEqual(1000, len(Stock.read(self.filename)))
+
+    def test_read_is_never_fetched(self):
+        stock = Stock.read(self.filename)
+        store.save('MINUTES', Stock.fields,
+                   [getattr(stock, field) for field in Stock.fields],
+                   datetime.date(2012, 5, 24), store.source('MINUTES'))
+        self.assertEqual(1000, len(Stock('MINUTES', raise_if_called)))
+
+    def test_refresh_intraday(self):
+        day = self.date < numpy.datetime64('2012-05-25T00:00:00')
+        columns = [self.date[day]] + [self.close[day]] * 4 + \
+            [self.volume[day], self.close[day]]
+        store.save('MINUTES', Stock.fields, columns, datetime.date(2012, 5, 24))
+        calls = []
+        def yahoo(symbol, start, end):
+            calls.append((start, end))
+            return [[]]
+        self.assertEqual(day.sum(), len(Stock('MINUTES', yahoo)))
+        self.assertEqual([('20120525', '20120525')], calls)
+
+    def test_resample(self):
+        stock = Stock.read(self.filename)
+        bars = stock.resample('5m')
+        self.assertEqual(numpy.dtype('M8[m]'), bars.date.dtype)
+        periods = self.date.astype('M8[m]').astype(int) // 5
+        for index, period in enumerate(numpy.unique(periods)):
+            selected = periods == period
+            self.assertEqual(period * 5, bars.date[index].astype(int))
+            self.assertEqual(self.close[selected][0], bars.open[index])
+            self.assertEqual(self.close[selected][-1], bars.close[index])
+            self.assertEqual(self.close[selected].max() + 0.5,
+                             bars.high[index])
+            self.assertEqual(self.close[selected].min() - 0.5,
+                             bars.low[index])
+            self.assertEqual(self.volume[selected].sum(), bars.volume[index])
+        chunk, Stock.chunk = Stock.chunk, 7
+        try:
+            chunked = stock.resample('5m')
+        finally:
+            Stock.chunk = chunk
+        for field in Stock.fields:
+            self.assertEqual(list(getattr(bars, field)),
+                             list(getattr(chunked, field)))
+        self.assertEqual(2, len(stock.resample('D')))
+        self.assertRaises(ValueError, stock.resample, '5 minutes')
+
+    def test_date_slices(self):
+        stock = Stock.read(self.filename)
+        day = stock['2012-05-25']
+        self.assertEqual(len(stock) - len(stock[:'2012-05-24']), len(day))
+        self.assertEqual(self.date[self.date >= numpy.datetime64('2012-05-25')]
+                         .tolist(), day.date.tolist())
+
+    def test_nanoseconds(self):
+        stock = Stock()
+        stock.set_columns([self.date.astype('M8[ns]')] + [self.close] * 6)
+        self.assertEqual(numpy.dtype('M8[ns]'), stock.date.dtype)
+        self.assertEqual(self.date[0].item(), stock[0].date)
+
+    def test_daily_dates_stay_days(self):
+        stock = Stock()
+        stock.set_columns([['2012-05-24', '2012-05-25']] + [[1.0, 2.0]] * 6)
+        self.assertEqual(numpy.dtype('M8[D]'), stock.date.dtype)
+        self.assertEqual(datetime.date(2012, 5, 25), stock[1].date)
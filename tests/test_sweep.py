@@ -0,0 +1,79 @@
+import unittest
+import datetime
+import shutil
+import tempfile
+
+from lib.stock import Stock
+from lib.backtest import BackTest
+from lib.cost import Cost
+from lib import store, sweep as sweep_module
+from lib.sweep import sweep, combinations
+from strategy import Bollinger
+from test_helpers import get_historical_prices, NewDate
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.cache, store.CACHE = store.CACHE, tempfile.mkdtemp()
+        self.goog = Stock('GOOG', get_historical_prices)
+        self.grid = {'n': [10, 30], 'k': [1, 2]}
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+        shutil.rmtree(store.CACHE)
+        store.CACHE = self.cache
+
+    def test_combinations(self):
+        self.assertEqual(4, len(combinations(self.grid)))
+        self.assertIn({'n': 30, 'k': 2}, combinations(self.grid))
+
+    def test_matches_backtest(self):
+        cost = lambda trade: 0.5 * trade / 100
+        results = sweep(Bollinger, self.grid, [self.goog], cost, processes=1)
+        self.assertEqual(4, len(results))
+        for result in results:
+            backtest = BackTest()
+            backtest.cost = cost
+            backtest(self.goog, Bollinger(**result.parameters))
+            self.assertEqual('GOOG', result.symbol)
+            self.assertEqual(len(backtest.trades), result.trades)
+            self.assertEqual(backtest.position, result.position)
+            self.assertEqual(backtest.gross, result.gross)
+            self.assertEqual(backtest.net, result.net)
+
+    def test_grid_signals(self):
+        parameters = combinations({'n': [1, 5, 30, 3000], 'k': [0, 0.5, 2]})
+        signals = Bollinger.grid_signals(self.goog, parameters)
+        self.assertEqual((len(self.goog), len(parameters)), signals.shape)
+        for column, kwargs in enumerate(parameters):
+            self.assertEqual(Bollinger(**kwargs).signals(self.goog).tolist(),
+                             signals[:, column].tolist())
+
+    def test_grid_matches_backtest(self):
+        grid = {'n': [2, 10, 30, 200], 'k': [0.5, 1, 2]}
+        cost = Cost(fixed=1, bps=10, slippage=0.1)
+        cells, sweep_module.CELLS = sweep_module.CELLS, len(self.goog) * 5
+        try:
+            batched = sweep(Bollinger, grid, [self.goog, self.goog], cost,
+                            processes=1)
+        finally:
+            sweep_module.CELLS = cells
+        self.assertEqual(24, len(batched))
+        for result in batched[12:]:
+            backtest = BackTest()
+            backtest.cost = cost
+            backtest(self.goog, Bollinger(**result.parameters))
+            self.assertEqual((len(backtest.trades), backtest.position,
+                              backtest.gross, backtest.net),
+                             (result.trades, result.position, result.gross,
+                              result.net))
+        self.assertEqual(batched, sweep(Bollinger, grid,
+                                        [self.goog, self.goog], cost,
+                                        processes=1, cache=True))
+
+    def test_process_pool(self):
+        stocks = [self.goog, self.goog]
+        self.assertEqual(sweep(Bollinger, self.grid, stocks, processes=1),
+                         sweep(Bollinger, self.grid, stocks, processes=2))
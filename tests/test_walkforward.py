@@ -0,0 +1,89 @@
+import unittest
+import datetime
+
+import numpy
+
+from lib.stock import Stock
+from lib.backtest import BackTest
+from lib.cost import Cost
+from lib.walkforward import walk_forward, windows
+from strategy import Bollinger
+from test_helpers import get_historical_prices, NewDate, clear_cache
+
+class TestWalkForward(unittest.TestCase):
+
+    def setUp(self):
+        self.built_in_date = datetime.date
+        datetime.date = NewDate
+        self.goog = Stock('GOOG', get_historical_prices)
+        len(self.goog)
+        clear_cache('GOOG')
+        self.grid = {'n': [10, 30], 'k': [1, 2]}
+
+    def tearDown(self):
+        datetime.date = self.built_in_date
+
+    def test_windows(self):
+        self.assertEqual([((0, 500), (500, 700)), ((200, 700), (700, 900))],
+                         windows(900, 500, 200))
+        self.assertEqual([], windows(600, 500, 200))
+        self.assertEqual(((0, 800), (800, 900)),
+                         windows(900, 500, 100, 100, True)[-1])
+
+    def test_window_shares_arrays_and_indicators(self):
+        upper = self.goog.upper_bb(30, 1)
+        window = self.goog.window(1000, 1250)
+        self.assertEqual(250, len(window))
+        self.assertTrue(numpy.may_share_memory(self.goog.close, window.close))
+        self.assertTrue(numpy.may_share_memory(upper, window.upper_bb(30, 1)))
+        self.assertEqual(list(upper[1000:1250]), list(window.upper_bb(30, 1)))
+        self.assertEqual(list(self.goog.ma(30)[1000:1250]),
+                         [tick.ma(30) for tick in window])
+        self.assertEqual(self.goog[1000].date, window[0].date)
+
+    def test_window_backtest(self):
+        window = self.goog.window(1000, 1250)
+        bollinger = Bollinger(30, 1)
+        vectorized = BackTest()(window, bollinger)
+        per_tick = BackTest()(window, lambda tick: bollinger(tick))
+        self.assertEqual([(t.order, t.tick.index) for t in per_tick.trades],
+                         [(t.order, t.tick.index) for t in vectorized.trades])
+        self.assertEqual(per_tick.net, vectorized.net)
+
+    def test_window_append_detaches(self):
+        window = self.goog.window(0, 100)
+        window.append(self.goog.bars().next())
+        self.assertEqual(101, len(window))
+        self.assertEqual(self.goog.close[0], window.close[100])
+        self.assertEqual(1958, len(self.goog))
+
+    def test_walk_forward(self):
+        cost = Cost(bps=50)
+        results = walk_forward(Bollinger, self.grid, self.goog, 500, 250,
+                               cost=cost, processes=1)
+        self.assertEqual(windows(1958, 500, 250),
+                         [(result.train, result.test) for result in results])
+        for result in results:
+            train = self.goog.window(*result.train)
+            nets = []
+            for n in self.grid['n']:
+                for k in self.grid['k']:
+                    backtest = BackTest()
+                    backtest.cost = cost
+                    nets.append(backtest(train, Bollinger(n, k)).net)
+            self.assertEqual(max(nets), result.train_net)
+            backtest = BackTest()
+            backtest.cost = cost
+            backtest(self.goog.window(*result.test),
+                     Bollinger(**result.parameters))
+            self.assertEqual((len(backtest.trades), backtest.position,
+                              backtest.gross, backtest.net),
+                             (result.trades, result.position, result.gross,
+                              result.net))
+
+    def test_process_pool(self):
+        self.assertEqual(
+            walk_forward(Bollinger, self.grid, self.goog, 500, 250,
+                         processes=1),
+            walk_forward(Bollinger, self.grid, self.goog, 500, 250,
+                         processes=2))